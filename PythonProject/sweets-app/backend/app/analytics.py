@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+from . import database
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+def _category_totals(categories, category):
+    return categories.setdefault(category, {"stock": 0, "stock_value": 0})
+
+async def roll_up(entries):
+    """Add a batch of ledger entries to the rollups."""
+    categories, sweets = {}, {}
+    for entry in entries:
+        totals = _category_totals(categories, entry["category"])
+        totals["stock"] += entry["change"]
+        totals["stock_value"] += entry["change"] * entry["price"]
+        if entry["sold"]:
+            revenue = entry["sold"] * entry["price"]
+            totals["units_sold"] = totals.get("units_sold", 0) + entry["sold"]
+            totals["revenue"] = totals.get("revenue", 0) + revenue
+            _, _, units_sold, previous = sweets.get(entry["sweet_id"], (None, None, 0, 0))
+            sweets[entry["sweet_id"]] = (entry["name"], entry["category"], units_sold + entry["sold"], previous + revenue)
+    await database.stats.add(categories, sweets)
+
+async def catalog_changed(before, after):
+    """Move a created, edited or deleted sweet's stock between category totals."""
+    categories = {}
+    for sweet, sign in ((before, -1), (after, 1)):
+        if sweet is not None:
+            totals = _category_totals(categories, sweet["category"])
+            totals["sweets"] = totals.get("sweets", 0) + sign
+            totals["stock"] += sign * sweet["quantity"]
+            totals["stock_value"] += sign * sweet["quantity"] * sweet["price"]
+    await database.stats.add(categories, {})
+
+async def reconcile():
+    # Increments that land while this runs can be overwritten; the next run
+    # picks them up.
+    await database.stats.reconcile_stock()
+    await database.stats.reconcile_sales()
+
+async def reconcile_periodically():
+    """Background task; rebuilds the rollups in case increments were lost."""
+    while True:
+        try:
+            await reconcile()
+        except Exception:
+            logger.exception("Could not reconcile the analytics rollups")
+        await asyncio.sleep(settings.ANALYTICS_RECONCILE_SECONDS)
@@ -1,46 +1,158 @@
-from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from .config import settings
-from .crud import get_user_by_id
-
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-
-async def get_password_hash(password):
-    return pwd_context.hash(password)
-
-async def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
-
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials"
-    )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = await get_user_by_id(user_id)
-    if user is None:
-        raise credentials_exception
-    return user
-
-async def get_current_active_user(current_user=Depends(get_current_user)):
-    return current_user
-
-async def get_admin_user(current_user=Depends(get_current_user)):
-    if not current_user.get("is_admin", False):
-        raise HTTPException(status_code=403, detail="Admins only")
-    return current_user
+import asyncio
+import functools
+import logging
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from jose.exceptions import JWTError
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from bson import ObjectId
+from . import metrics
+from .cache import AsyncTTLCache
+from .config import settings
+from .crud import get_user_by_id, get_token_versions, revoke_tokens
+
+logger = logging.getLogger(__name__)
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+
+_payloads = AsyncTTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS, settings.AUTH_CACHE_ENABLED)
+_principals = AsyncTTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS, settings.AUTH_CACHE_ENABLED)
+# user id -> token version; tokens carrying an older "ver" claim are revoked.
+_token_versions = {}
+
+_hash_pool = None
+_hash_pending = 0
+
+# passlib/argon2 and python-jose's JWT backends are imported on first use
+# rather than when a worker starts; see benchmarks/cold_start.py.
+@functools.cache
+def _pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=settings.ARGON2_TIME_COST,
+        argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+        argon2__parallelism=settings.ARGON2_PARALLELISM,
+    )
+
+def _hash(password):
+    return _pwd_context().hash(password)
+
+def _verify(plain, hashed):
+    return _pwd_context().verify(plain, hashed)
+
+def _get_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        if settings.HASH_EXECUTOR == "process":
+            _hash_pool = ProcessPoolExecutor(max_workers=settings.HASH_WORKERS)
+        else:
+            _hash_pool = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix="argon2")
+    return _hash_pool
+
+async def _run_hashing(name, func, *args):
+    # Argon2 takes tens of milliseconds of CPU; keep it off the event loop and
+    # shed load once the pool's queue is full instead of stalling every request.
+    global _hash_pending
+    if _hash_pending >= settings.HASH_WORKERS + settings.HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, try again shortly",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        with metrics.span(name):
+            return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), func, *args)
+    finally:
+        _hash_pending -= 1
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+async def get_password_hash(password):
+    return await _run_hashing("argon2_hash", _hash, password)
+
+async def verify_password(plain, hashed):
+    return await _run_hashing("argon2_verify", _verify, plain, hashed)
+
+def create_access_token(data: dict, expires_delta: timedelta | None = None):
+    from jose import jwt
+    to_encode = data.copy()
+    now = datetime.now(timezone.utc)
+    expire = now + (expires_delta or timedelta(minutes=15))
+    to_encode.update({"exp": expire, "iat": now, "jti": secrets.token_urlsafe(8)})
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def _remaining_lifetime(payload):
+    return min(settings.AUTH_CACHE_TTL_SECONDS, payload["exp"] - time.time())
+
+async def _decode(token):
+    from jose import jwt
+    with metrics.span("jwt_decode"):
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+
+async def _load_user(user_id):
+    with metrics.span("user_lookup"):
+        return await get_user_by_id(user_id)
+
+async def get_token_payload(token: str = Depends(oauth2_scheme)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials"
+    )
+    try:
+        payload = await _payloads.get_or_load(token, lambda: _decode(token), ttl=_remaining_lifetime)
+    except JWTError:
+        raise credentials_exception
+    user_id = payload.get("sub")
+    if user_id is None or not ObjectId.is_valid(user_id):
+        raise credentials_exception
+    if payload.get("ver", 0) < _token_versions.get(user_id, 0):
+        raise credentials_exception
+    return payload
+
+async def get_current_user(token: str = Depends(oauth2_scheme), payload=Depends(get_token_payload)):
+    user_id = payload["sub"]
+    user = await _principals.get_or_load(
+        token, lambda: _load_user(user_id), tags=lambda _: [user_id], ttl=lambda _: _remaining_lifetime(payload)
+    )
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return user
+
+async def get_current_active_user(current_user=Depends(get_current_user)):
+    return current_user
+
+async def get_admin_user(token: str = Depends(oauth2_scheme), payload=Depends(get_token_payload)):
+    if settings.AUTH_TRUST_ADMIN_CLAIM:
+        # The claim was set by login from the stored user; revocation is still
+        # enforced by get_token_payload.
+        if not payload.get("is_admin", False):
+            raise HTTPException(status_code=403, detail="Admins only")
+        return {"_id": ObjectId(payload["sub"]), "is_admin": True}
+    current_user = await get_current_user(token, payload)
+    if not current_user.get("is_admin", False):
+        raise HTTPException(status_code=403, detail="Admins only")
+    return current_user
+
+async def revoke_user_tokens(user_id):
+    expires_at = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    _token_versions[user_id] = await revoke_tokens(user_id, expires_at)
+    _principals.invalidate_tag(user_id)
+
+async def refresh_token_versions():
+    """Keep the revocation table in step with logouts handled by other workers."""
+    global _token_versions
+    while True:
+        try:
+            _token_versions = await get_token_versions()
+        except Exception:
+            logger.exception("Could not refresh token revocations")
+        await asyncio.sleep(settings.AUTH_REVOCATION_REFRESH_SECONDS)
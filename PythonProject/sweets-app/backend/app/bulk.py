@@ -0,0 +1,194 @@
+import codecs
+import csv
+import io
+from collections import deque
+
+import orjson
+from bson import ObjectId
+from pydantic import ValidationError
+
+from .schemas import SweetCreate
+
+EXPORT_FIELDS = ("id", "name", "category", "price", "quantity")
+MAX_LINE_LENGTH = 1 << 20
+
+class RowError(ValueError):
+    pass
+
+async def _line_batches(chunks):
+    # Decodes across chunk boundaries and drops a UTF-8 BOM, as spreadsheet
+    # exports often start with one. Yields the lines completed by each chunk.
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        try:
+            pending += decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise RowError("the upload is not valid UTF-8")
+        *lines, pending = pending.split("\n")
+        if lines:
+            yield [line.rstrip("\r") for line in lines]
+        if len(pending) > MAX_LINE_LENGTH:
+            # Keeps a file without newlines from being buffered whole.
+            raise RowError(f"line longer than {MAX_LINE_LENGTH} characters")
+    pending += decoder.decode(b"", final=True)
+    if pending.rstrip("\r"):
+        yield [pending.rstrip("\r")]
+
+async def _lines(chunks):
+    async for lines in _line_batches(chunks):
+        for line in lines:
+            yield line
+
+class _LineFeed:
+    """The lines decoded so far, for csv.reader to pull from.
+
+    csv.reader reads on by itself while a quoted field spans lines. If the
+    lines run out partway through a record, put_back returns the ones it took,
+    to be parsed again once more have arrived.
+    """
+
+    def __init__(self):
+        self.lines = deque()
+        self.buffered = 0
+        self.taken = []
+        self.taken_length = 0
+        self.ran_out = False
+
+    def push(self, lines):
+        for line in lines:
+            # csv.reader needs the newlines to keep them inside quoted fields.
+            self.lines.append(line + "\n")
+            self.buffered += len(line) + 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            self.ran_out = True
+            raise StopIteration
+        line = self.lines.popleft()
+        self.buffered -= len(line)
+        self.taken.append(line)
+        self.taken_length += len(line)
+        if self.taken_length > MAX_LINE_LENGTH:
+            # Likewise for a quoted field that never closes.
+            raise RowError(f"record longer than {MAX_LINE_LENGTH} characters")
+        return line
+
+    def record_done(self):
+        self.taken = []
+        self.taken_length = 0
+
+    def put_back(self):
+        self.lines.extendleft(reversed(self.taken))
+        self.buffered += self.taken_length
+        self.record_done()
+
+def _parsed(reader, feed):
+    # The records complete in the lines fed so far.
+    while True:
+        feed.ran_out = False
+        try:
+            values = next(reader)
+        except StopIteration:
+            values = None
+        except csv.Error as exc:
+            feed.record_done()
+            yield RowError(str(exc))
+            continue
+        if feed.ran_out:
+            feed.put_back()
+            return
+        feed.record_done()
+        yield values
+
+async def _csv_records(chunks):
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    header = None
+
+    def records():
+        nonlocal header
+        for values in _parsed(reader, feed):
+            if isinstance(values, RowError):
+                yield values
+            elif len(values) <= 1 and not "".join(values).strip():
+                continue
+            elif header is None:
+                header = [name.strip().lower() for name in values]
+            elif len(values) != len(header):
+                yield RowError(f"expected {len(header)} columns, got {len(values)}")
+            else:
+                yield dict(zip(header, values))
+
+    wait_for = 0
+    async for lines in _line_batches(chunks):
+        feed.push(lines)
+        # An open quoted field is parsed again only once the buffered lines
+        # have doubled, so one arriving in many small chunks costs linear time.
+        if feed.buffered < wait_for:
+            continue
+        for record in records():
+            yield record
+        wait_for = 2 * feed.buffered
+    for record in records():
+        yield record
+    if feed.lines:
+        yield RowError("unterminated quoted field")
+
+async def _ndjson_records(chunks):
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as exc:
+            yield RowError(f"invalid JSON: {exc}")
+            continue
+        yield record if isinstance(record, dict) else RowError("expected a JSON object")
+
+def _sweet(record):
+    if isinstance(record, RowError):
+        raise record
+    sweet_id = record.get("id") or None
+    if sweet_id is not None and not ObjectId.is_valid(sweet_id):
+        raise RowError(f"invalid id {sweet_id!r}")
+    try:
+        sweet = SweetCreate.model_validate(record)
+    except ValidationError as exc:
+        raise RowError("; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()))
+    return sweet, sweet_id
+
+async def read_sweets(chunks, format):
+    """Parse an uploaded CSV or NDJSON catalog one record at a time.
+
+    Yields (row number, (SweetCreate, id or None) or RowError); rows are
+    numbered from 1, not counting a CSV header.
+    """
+    records = _csv_records(chunks) if format == "csv" else _ndjson_records(chunks)
+    row = 0
+    async for record in records:
+        row += 1
+        try:
+            yield row, _sweet(record)
+        except RowError as exc:
+            yield row, exc
+
+async def to_csv(sweets):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    async for sweet in sweets:
+        writer.writerow([sweet[field] for field in EXPORT_FIELDS])
+        # Flush roughly every 64 KiB instead of once per row.
+        if buffer.tell() >= 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+async def to_ndjson(sweets):
+    async for sweet in sweets:
+        yield orjson.dumps(sweet, option=orjson.OPT_APPEND_NEWLINE)
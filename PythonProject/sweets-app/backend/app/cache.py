@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+
+from pymongo.errors import PyMongoError
+
+from . import database
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class AsyncTTLCache:
+    """LRU cache with a per-entry TTL, tag-based invalidation and single-flight loads.
+
+    Cached values are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries, ttl, enabled=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._inflight = {}
+        # Invalidations while loads are in flight: ("key" | "tag" | "kind",
+        # name) -> clock when last invalidated, so a load is only discarded if
+        # something it depends on changed after it started.
+        self._clock = 0
+        self._invalidated = {}
+        self._cleared = 0
+
+    async def get_or_load(self, key, loader, tags=None, ttl=None):
+        if not self.enabled:
+            return await loader()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._remove(key)
+
+        # Concurrent misses on the same key share one load.
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight[0])
+        self.misses += 1
+        # The load is a task of its own, so cancelling the request that started
+        # it (a client disconnect) does not cancel it for the requests waiting.
+        load = asyncio.ensure_future(self._load(key, loader, tags, ttl, self._clock))
+        load.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = (load, self._clock)
+        return await asyncio.shield(load)
+
+    async def _load(self, key, loader, tags, ttl, started):
+        try:
+            value = await loader()
+            tags = frozenset(tags(value)) if tags else frozenset()
+            # Anything it depends on that was invalidated while we were
+            # loading may be baked into value.
+            changed = self._changed_since(key, tags, started)
+        finally:
+            del self._inflight[key]
+            self._forget_invalidations()
+        if not changed:
+            ttl = ttl(value) if callable(ttl) else ttl or self.ttl
+            if ttl > 0:
+                self._store(key, value, tags, ttl)
+        return value
+
+    def _changed_since(self, key, tags, started):
+        if self._cleared > started:
+            return True
+        depends = [("key", key), *(("tag", tag) for tag in tags)]
+        if isinstance(key, tuple):
+            depends.append(("kind", key[0]))
+        return any(self._invalidated.get(name, 0) > started for name in depends)
+
+    def _invalidate(self, name):
+        # Only loads in flight can be affected.
+        self._clock += 1
+        if self._inflight:
+            self._invalidated[name] = self._clock
+
+    def _forget_invalidations(self):
+        if not self._inflight:
+            self._invalidated.clear()
+        elif len(self._invalidated) > self.max_entries:
+            oldest = min(started for _, started in self._inflight.values())
+            self._invalidated = {name: at for name, at in self._invalidated.items() if at > oldest}
+
+    def _store(self, key, value, tags, ttl):
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+    def invalidate(self, key):
+        self._invalidate(("key", key))
+        self.invalidations += self._remove(key)
+
+    def invalidate_tag(self, tag):
+        self._invalidate(("tag", tag))
+        for key in list(self._tags.get(tag, ())):
+            self.invalidations += self._remove(key)
+
+    def invalidate_kinds(self, *kinds):
+        for kind in kinds:
+            self._invalidate(("kind", kind))
+        for key in [k for k in self._entries if k[0] in kinds]:
+            self.invalidations += self._remove(key)
+
+    def clear(self):
+        self._clock += 1
+        self._cleared = self._clock
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "inflight": len(self._inflight),
+        }
+
+catalog = AsyncTTLCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS, settings.CACHE_ENABLED)
+# sweet id -> number of stock counters, so purchases need not read the sweet first.
+layouts = AsyncTTLCache(settings.CACHE_MAX_ENTRIES, settings.STOCK_LAYOUT_TTL_SECONDS, settings.CACHE_ENABLED)
+
+# Bumped on every catalog mutation seen by this worker; the boot id keeps
+# versions from different workers (or restarts) from ever comparing equal.
+boot_id = secrets.token_hex(4)
+version = 0
+# Whether watch_catalog_changes is connected, so this worker sees every write.
+watching = False
+
+def etag():
+    if watching:
+        return f'"{boot_id}-{version}"'
+    # Otherwise writes made by other workers never bump version. The tag also
+    # changes every CACHE_TTL_SECONDS, so such a write stops being answered
+    # with 304 within two TTLs, once any cached copy of the old body expired.
+    window = int(time.monotonic() // max(settings.CACHE_TTL_SECONDS, 1))
+    return f'"{boot_id}-{version}-{window}"'
+
+def invalidate_all():
+    global version
+    version += 1
+    catalog.clear()
+
+def invalidate_sweet(sweet_id, listings=True):
+    global version
+    version += 1
+    # Cached pages are tagged with the ids they contain, so a stock-only change
+    # drops just those. Changes that can move a sweet into other listings or
+    # searches (create, update) drop every listing.
+    catalog.invalidate_tag(sweet_id)
+    # Facets count every matching sweet, so any change, even to stock alone
+    # (in_stock), can move them.
+    catalog.invalidate_tag("facets")
+    if listings:
+        catalog.invalidate_kinds("list", "search")
+
+async def watch_catalog_changes():
+    """Invalidate on writes made by other workers, via a MongoDB change stream."""
+    global watching
+    # Split stock lives in stock_shards, keyed "<sweet id>:<counter>".
+    pipeline = [{"$match": {"ns.coll": {"$in": ["sweets", "stock_shards"]}}}]
+    while True:
+        try:
+            async with database.db.watch(pipeline) as stream:
+                # Events may have been missed while (re)connecting.
+                invalidate_all()
+                watching = True
+                async for change in stream:
+                    operation = change["operationType"]
+                    if "documentKey" not in change:
+                        invalidate_all()
+                        continue
+                    sweet_id = str(change["documentKey"]["_id"])
+                    if change["ns"]["coll"] == "stock_shards":
+                        invalidate_sweet(sweet_id.split(":")[0], listings=False)
+                    elif operation == "update":
+                        fields = change["updateDescription"]["updatedFields"]
+                        invalidate_sweet(sweet_id, listings=not set(fields) <= {"quantity"})
+                    else:
+                        invalidate_sweet(sweet_id, listings=operation != "delete")
+        except PyMongoError:
+            logger.exception("Catalog change stream failed, retrying")
+            await asyncio.sleep(1)
+        finally:
+            watching = False
@@ -1,12 +1,133 @@
-from pydantic_settings import BaseSettings, SettingsConfigDict
-
-class Settings(BaseSettings):
-    MONGO_URL: str
-    MONGO_DB_NAME: str
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
-    SECRET_KEY: str = "your-secret-key-change-in-production"
-    ALGORITHM: str = "HS256"
-
-    model_config = SettingsConfigDict(env_file=".env")
-
-settings = Settings()
+from pydantic import model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+class Settings(BaseSettings):
+    # "mongo", or "memory" for an in-process engine (load tests, profiling).
+    STORAGE_BACKEND: str = "mongo"
+    MONGO_URL: str = "mongodb://localhost:27017"
+    MONGO_DB_NAME: str = "sweets_db"
+    # Connections each worker process may open to MongoDB. If
+    # MONGO_MAX_CONNECTIONS is set it is shared out between the workers instead.
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MAX_CONNECTIONS: int = 0
+    # Connections each worker opens at startup and keeps open; startup waits
+    # up to MONGO_PREWARM_TIMEOUT_SECONDS for them.
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_PREWARM_TIMEOUT_SECONDS: float = 10.0
+    # Connections a pool may be establishing at the same time.
+    MONGO_MAX_CONNECTING: int = 2
+    MONGO_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    MONGO_SERVER_SELECTION_TIMEOUT_SECONDS: float = 10.0
+    # Wire compression in order of preference, e.g. "zstd,snappy,zlib"; zstd
+    # and snappy need the zstandard and python-snappy packages.
+    MONGO_COMPRESSORS: str = ""
+    # Read preference for listings, search and single-sweet reads, e.g.
+    # "secondaryPreferred"; stock changes always go to the primary with
+    # majority writes. Reads from a secondary wait until it has every write
+    # this worker has made or seen, so the catalog cache is never refilled
+    # with values older than the write that invalidated it.
+    MONGO_CATALOG_READ_PREFERENCE: str = "primary"
+    # Secondaries further behind than this are not read from; -1 for no
+    # bound, otherwise at least 90 (not with "primary").
+    MONGO_CATALOG_MAX_STALENESS_SECONDS: int = -1
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    SECRET_KEY: str = "your-secret-key-change-in-production"
+    ALGORITHM: str = "HS256"
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    # Hashing runs off the event loop in a "thread" or "process" pool.
+    HASH_EXECUTOR: str = "thread"
+    HASH_WORKERS: int = 2
+    # Hash requests allowed to wait for a worker before callers get a 503.
+    HASH_QUEUE_LIMIT: int = 32
+    # Decoded tokens and their users are cached for at most this long (and
+    # never past the token's exp), so revocations apply within this window.
+    AUTH_CACHE_ENABLED: bool = True
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_REVOCATION_REFRESH_SECONDS: float = 5.0
+    # Authorize admin routes from the token's is_admin claim without a user lookup.
+    AUTH_TRUST_ADMIN_CLAIM: bool = False
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_TTL_SECONDS: float = 30.0
+    # Needs a replica set; lets every worker see the others' writes.
+    CACHE_CHANGE_STREAM: bool = False
+    # Unconfirmed reservations give their stock back after this long; a sweeper
+    # in every worker checks for expired ones this often.
+    RESERVATION_TTL_SECONDS: int = 300
+    RESERVATION_SWEEP_SECONDS: float = 5.0
+    # A sweeper that took an expired reservation but failed to give its stock
+    # back leaves it to be retried after this long.
+    RESERVATION_CLAIM_SECONDS: float = 60.0
+    # How long a worker trusts its view of which sweets have split stock.
+    STOCK_LAYOUT_TTL_SECONDS: float = 5.0
+    # Stock changes are appended to the inventory ledger in batches of up to
+    # LEDGER_BATCH_SIZE, at most LEDGER_FLUSH_SECONDS apart; requests wait
+    # while LEDGER_MAX_PENDING entries are queued.
+    LEDGER_BATCH_SIZE: int = 500
+    LEDGER_FLUSH_SECONDS: float = 0.2
+    LEDGER_MAX_PENDING: int = 10000
+    # "buffered", or "sync" to have requests wait until their entry is written.
+    LEDGER_DURABILITY: str = "buffered"
+    # The analytics rollups are rebuilt from the catalog and the ledger this
+    # often, correcting any increments that were lost; 0 disables.
+    ANALYTICS_RECONCILE_SECONDS: float = 3600.0
+    # GET /api/sweets/events sends changed sweets at most this often per worker.
+    EVENTS_COALESCE_SECONDS: float = 0.25
+    EVENTS_MAX_SUBSCRIBERS: int = 10000
+    # Messages a subscriber may fall behind by before it is dropped.
+    EVENTS_QUEUE_SIZE: int = 64
+    EVENTS_KEEPALIVE_SECONDS: float = 15.0
+    EVENTS_RETRY_MILLISECONDS: int = 3000
+    # Needs a replica set; without it each worker only sends its own writes.
+    EVENTS_CHANGE_STREAM: bool = False
+    # GET /api/sweets/facets: price histogram bucket boundaries (at least two
+    # distinct values; prices below the first and from the last up get
+    # open-ended buckets of their own) and the most categories listed.
+    FACET_PRICE_BOUNDARIES: list[float] = [0, 1, 2, 5, 10, 20, 50, 100]
+    FACET_MAX_CATEGORIES: int = 100
+    # Catalog imports are upserted in unordered batches of this many rows.
+    IMPORT_BATCH_SIZE: int = 1000
+    # Row errors listed in an import summary; the rest are only counted.
+    IMPORT_MAX_ERRORS: int = 100
+    # Per-route histograms, Mongo command tracing and GET /metrics.
+    METRICS_ENABLED: bool = True
+    # Log requests slower than this with a per-request breakdown; 0 disables.
+    SLOW_REQUEST_SECONDS: float = 0.0
+    # serve.py, the production launcher: one worker per available core unless
+    # WEB_WORKERS is set, but only one if CACHE_CHANGE_STREAM and
+    # EVENTS_CHANGE_STREAM are not both on (workers would not see each
+    # other's writes).
+    WEB_HOST: str = "0.0.0.0"
+    WEB_PORT: int = 8000
+    WEB_WORKERS: int = 0
+    # Longer than a load balancer's idle timeout, so it never reuses a
+    # connection the server has just closed.
+    WEB_KEEPALIVE_SECONDS: int = 75
+    WEB_BACKLOG: int = 2048
+    # After SIGTERM, requests in flight get this long to finish.
+    WEB_GRACEFUL_SECONDS: int = 30
+    # GET /health/ready fails when storage takes longer than this to answer.
+    HEALTH_TIMEOUT_SECONDS: float = 2.0
+
+    model_config = SettingsConfigDict(env_file=".env")
+
+    @model_validator(mode="after")
+    def _check_catalog_staleness(self):
+        staleness = self.MONGO_CATALOG_MAX_STALENESS_SECONDS
+        if staleness != -1 and staleness < 90:
+            raise ValueError("MONGO_CATALOG_MAX_STALENESS_SECONDS must be -1 or at least 90")
+        if staleness != -1 and self.MONGO_CATALOG_READ_PREFERENCE == "primary":
+            raise ValueError("MONGO_CATALOG_MAX_STALENESS_SECONDS cannot be used with the primary read preference")
+        return self
+
+    @model_validator(mode="after")
+    def _check_facet_price_boundaries(self):
+        # $bucket needs two boundaries; duplicates are dropped before use.
+        if len(set(self.FACET_PRICE_BOUNDARIES)) < 2:
+            raise ValueError("FACET_PRICE_BOUNDARIES needs at least 2 distinct values")
+        return self
+
+settings = Settings()
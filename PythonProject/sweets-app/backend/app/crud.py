@@ -1,66 +1,402 @@
-from . import database
-from bson import ObjectId
-
-async def create_user(email, hashed_password, is_admin=False):
-    doc = {"email": email, "hashed_password": hashed_password, "is_admin": is_admin}
-    res = await database.db.users.insert_one(doc)
-    doc["_id"] = res.inserted_id
-    return doc
-
-async def get_user_by_email(email):
-    return await database.db.users.find_one({"email": email})
-
-async def get_user_by_id(user_id):
-    return await database.db.users.find_one({"_id": ObjectId(user_id)})
-
-async def create_sweet(sweet):
-    sweet_dict = sweet.model_dump()
-    res = await database.db.sweets.insert_one(sweet_dict)
-    sweet_dict["_id"] = res.inserted_id
-    return {**sweet_dict, "id": str(res.inserted_id)}
-
-async def list_sweets():
-    sweets = await database.db.sweets.find().to_list(100)
-    for s in sweets:
-        s["id"] = str(s["_id"])
-    return sweets
-
-async def get_sweet_by_id(sweet_id):
-    sweet = await database.db.sweets.find_one({"_id": ObjectId(sweet_id)})
-    if sweet:
-        sweet["id"] = str(sweet["_id"])
-    return sweet
-
-async def search_sweets(name=None, category=None, min_price=None, max_price=None):
-    query = {}
-    if name:
-        query["name"] = {"$regex": name, "$options": "i"}
-    if category:
-        query["category"] = {"$regex": category, "$options": "i"}
-    if min_price or max_price:
-        query["price"] = {}
-        if min_price:
-            query["price"]["$gte"] = min_price
-        if max_price:
-            query["price"]["$lte"] = max_price
-    sweets = await database.db.sweets.find(query).to_list(100)
-    for s in sweets:
-        s["id"] = str(s["_id"])
-    return sweets
-
-async def update_sweet(sweet_id, sweet):
-    update = {"$set": sweet.model_dump()}
-    result = await database.db.sweets.update_one({"_id": ObjectId(sweet_id)}, update)
-    if result.modified_count == 0:
-        return None
-    return await get_sweet_by_id(sweet_id)
-
-async def delete_sweet(sweet_id):
-    result = await database.db.sweets.delete_one({"_id": ObjectId(sweet_id)})
-    return result.deleted_count > 0
-
-async def purchase_sweet(sweet_id, quantity):
-    await database.db.sweets.update_one({"_id": ObjectId(sweet_id)}, {"$inc": {"quantity": -quantity}})
-
-async def restock_sweet(sweet_id, quantity):
-    await database.db.sweets.update_one({"_id": ObjectId(sweet_id)}, {"$inc": {"quantity": quantity}})
+import asyncio
+import base64
+import logging
+from datetime import datetime, timedelta, timezone
+from . import analytics, cache, database, events, ledger
+from .bulk import RowError
+from .config import settings
+from .repository import SweetQuery, search_fields
+from bson import ObjectId
+from bson.errors import InvalidId
+
+logger = logging.getLogger(__name__)
+
+class InvalidCursor(ValueError):
+    pass
+
+class InsufficientStock(Exception):
+    def __init__(self, sweet):
+        super().__init__("Not enough stock")
+        self.sweet = sweet
+
+async def create_user(email, hashed_password, is_admin=False):
+    doc = {"email": email, "hashed_password": hashed_password, "is_admin": is_admin}
+    return await database.users.insert(doc)
+
+async def get_user_by_email(email):
+    return await database.users.get_by_email(email)
+
+async def get_user_by_id(user_id):
+    return await database.users.get(user_id)
+
+async def get_token_version(user_id):
+    return await database.users.token_version(user_id)
+
+async def get_token_versions():
+    return await database.users.token_versions()
+
+async def revoke_tokens(user_id, expires_at):
+    return await database.users.bump_token_version(user_id, expires_at)
+
+def _normalized(sweet):
+    doc = sweet.model_dump()
+    doc.update(search_fields(doc))
+    return doc
+
+def _sweet_changed(sweet_id, listings=True):
+    cache.invalidate_sweet(sweet_id, listings)
+    events.sweet_changed(sweet_id)
+
+def _with_id(sweet):
+    if sweet is not None:
+        sweet["id"] = str(sweet["_id"])
+    return sweet
+
+async def create_sweet(sweet):
+    sweet_dict = await database.sweets.insert(_normalized(sweet))
+    _sweet_changed(str(sweet_dict["_id"]))
+    await analytics.catalog_changed(None, sweet_dict)
+    return _with_id(sweet_dict)
+
+def encode_cursor(object_id):
+    return base64.urlsafe_b64encode(object_id.binary).rstrip(b"=").decode()
+
+def decode_cursor(cursor):
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError, InvalidId):
+        raise InvalidCursor(cursor)
+
+async def _page(query, cursor, limit):
+    # Keyset pagination on _id: fetch one extra document to know whether
+    # another page follows.
+    after = decode_cursor(cursor) if cursor else None
+    sweets = await database.sweets.find(query, after, limit + 1)
+    next_cursor = None
+    if len(sweets) > limit:
+        sweets = sweets[:limit]
+        next_cursor = encode_cursor(ObjectId(sweets[-1]["id"]))
+    return sweets, next_cursor
+
+def _page_ids(page):
+    return [s["id"] for s in page[0]]
+
+async def list_sweets(cursor=None, limit=100):
+    return await cache.catalog.get_or_load(
+        ("list", cursor, limit), lambda: _page(SweetQuery(), cursor, limit), tags=_page_ids
+    )
+
+def stream_sweets(cursor=None, limit=None):
+    after = decode_cursor(cursor) if cursor else None
+    return database.sweets.stream(SweetQuery(), after, limit)
+
+async def _load_sweet(sweet_id):
+    return _with_id(await database.sweets.get_for_display(sweet_id))
+
+async def get_sweet_by_id(sweet_id):
+    return await cache.catalog.get_or_load(
+        ("sweet", sweet_id), lambda: _load_sweet(sweet_id), tags=lambda _: [sweet_id]
+    )
+
+async def search_sweets(
+    name=None, category=None, min_price=None, max_price=None, cursor=None, limit=100, text=None, text_fields=None
+):
+    """name, category and the price range are ANDed; text matches sweets whose
+    text_fields (default: name and category) start with it."""
+    query = SweetQuery.build(name, category, min_price, max_price, text, text_fields)
+    return await cache.catalog.get_or_load(
+        ("search", query, cursor, limit), lambda: _page(query, cursor, limit), tags=_page_ids
+    )
+
+def stream_search_sweets(
+    name=None, category=None, min_price=None, max_price=None, cursor=None, limit=None, text=None, text_fields=None
+):
+    after = decode_cursor(cursor) if cursor else None
+    query = SweetQuery.build(name, category, min_price, max_price, text, text_fields)
+    return database.sweets.stream(query, after, limit)
+
+async def get_facets(name=None, category=None, min_price=None, max_price=None, text=None, text_fields=None):
+    """Category counts, price histogram and in-stock count for a search filter."""
+    query = SweetQuery.build(name, category, min_price, max_price, text, text_fields)
+    boundaries = sorted(set(settings.FACET_PRICE_BOUNDARIES))
+    return await cache.catalog.get_or_load(
+        ("facets", query),
+        lambda: database.sweets.facets(query, boundaries, settings.FACET_MAX_CATEGORIES),
+        tags=lambda _: ["facets"],
+    )
+
+async def update_sweet(sweet_id, sweet):
+    # Read first so the analytics can move the old stock out of its category.
+    before = await database.sweets.get(sweet_id)
+    updated = await database.sweets.replace(sweet_id, _normalized(sweet))
+    if updated is None:
+        return None
+    _sweet_changed(sweet_id)
+    await analytics.catalog_changed(before, updated)
+    return _with_id(updated)
+
+async def delete_sweet(sweet_id):
+    before = await database.sweets.get(sweet_id)
+    deleted = await database.sweets.delete(sweet_id)
+    # Deleting can only shrink listings, and every cached page holding the
+    # sweet is tagged with it.
+    _sweet_changed(sweet_id, listings=False)
+    if deleted and before:
+        await analytics.catalog_changed(before, None)
+    return deleted
+
+async def _load_stock_shards(sweet_id):
+    sweet = await database.sweets.get(sweet_id)
+    return sweet.get("stock_shards", 1) if sweet else 1
+
+async def _stock_shards(sweet_id):
+    # Possibly stale for STOCK_LAYOUT_TTL_SECONDS; the repository copes with that.
+    return await cache.layouts.get_or_load(sweet_id, lambda: _load_stock_shards(sweet_id))
+
+async def _take(sweet_id, quantity):
+    """Decrement stock; True if taken, False if too little, None if the sweet is missing."""
+    shards = await _stock_shards(sweet_id)
+    if shards > 1:
+        return await database.sweets.take_sharded(sweet_id, quantity, shards)
+    before = await database.sweets.take(sweet_id, quantity)
+    return None if before is None else before["quantity"] >= quantity
+
+async def _add(sweet_id, quantity):
+    shards = await _stock_shards(sweet_id)
+    if shards > 1:
+        return await database.sweets.add_sharded(sweet_id, quantity, shards)
+    return await database.sweets.add(sweet_id, quantity)
+
+async def split_stock(sweet_id, shards):
+    split = await database.sweets.split_stock(sweet_id, shards)
+    cache.layouts.invalidate(sweet_id)
+    _sweet_changed(sweet_id, listings=False)
+    return split
+
+async def _record(kind, sweet, change, user_id=None, sold=0):
+    # change is the stock movement and sold the units that count as sales.
+    # The sweet's category and price at the time go along, so the rollups
+    # credit the category it was in and the price it sold at.
+    await ledger.inventory.record({
+        "sweet_id": ObjectId(sweet["_id"]), "name": sweet["name"], "category": sweet["category"],
+        "price": sweet["price"], "kind": kind, "change": change, "sold": sold,
+        "user_id": user_id, "at": datetime.now(timezone.utc),
+    })
+
+async def purchase_sweet(sweet_id, quantity, user_id=None):
+    if await _stock_shards(sweet_id) > 1:
+        # Split stock has no single pre-image, so the sweet is read back.
+        taken = await _take(sweet_id, quantity)
+        _sweet_changed(sweet_id, listings=False)
+        sweet = await _load_sweet(sweet_id) if taken is not None else None
+        if sweet is None:
+            return None
+        if not taken:
+            raise InsufficientStock(sweet)
+        await _record("purchase", sweet, -quantity, user_id, sold=quantity)
+        return sweet
+    # One atomic conditional decrement; the pre-image tells "not found" (None)
+    # apart from "insufficient stock" without a second round trip.
+    before = _with_id(await database.sweets.take(sweet_id, quantity))
+    if before is None:
+        return None
+    if before["quantity"] < quantity:
+        raise InsufficientStock(before)
+    _sweet_changed(sweet_id, listings=False)
+    await _record("purchase", before, -quantity, user_id, sold=quantity)
+    before["quantity"] -= quantity
+    return before
+
+async def restock_sweet(sweet_id, quantity, user_id=None):
+    sweet = await get_sweet_by_id(sweet_id)
+    restocked = sweet is not None and await _add(sweet_id, quantity)
+    _sweet_changed(sweet_id, listings=False)
+    if restocked:
+        await _record("restock", sweet, quantity, user_id)
+    return restocked
+
+async def _find_ordered(wanted):
+    return {
+        str(s["_id"]): s
+        for s in await database.sweets.get_many([i for i in wanted if ObjectId.is_valid(i)])
+    }
+
+def _order_lines(wanted, found):
+    lines = []
+    for sweet_id, quantity in wanted.items():
+        sweet = found.get(sweet_id)
+        line = {"sweet_id": sweet_id, "quantity": quantity}
+        if sweet is None:
+            line["status"] = "not_found"
+        elif sweet["quantity"] < quantity:
+            line.update(status="insufficient_stock", name=sweet["name"], available=sweet["quantity"])
+        else:
+            line.update(status="ok", name=sweet["name"], remaining=sweet["quantity"] - quantity)
+        lines.append(line)
+    return lines
+
+async def _take_each(wanted):
+    # Split stock cannot join take_many's single update, so lines are taken
+    # one by one and put back if a later one falls short.
+    taken = []
+    for sweet_id, quantity in wanted.items():
+        if not await _take(sweet_id, quantity):
+            for done_id, done_quantity in taken:
+                await _add(done_id, done_quantity)
+            return False
+        taken.append((sweet_id, quantity))
+    return True
+
+async def checkout(items, user_id=None):
+    wanted = {}
+    for sweet_id, quantity in items:
+        wanted[sweet_id] = wanted.get(sweet_id, 0) + quantity
+    found = await _find_ordered(wanted)
+    lines = _order_lines(wanted, found)
+    if any(line["status"] != "ok" for line in lines):
+        return False, lines
+    if any([await _stock_shards(sweet_id) > 1 for sweet_id in wanted]):
+        placed = await _take_each(wanted)
+    else:
+        placed = await database.sweets.take_many(wanted)
+    for sweet_id in wanted:
+        _sweet_changed(sweet_id, listings=False)
+    if not placed:
+        # Lost a race with another purchase; report the stock as it is now.
+        return False, _order_lines(wanted, await _find_ordered(wanted))
+    for sweet_id, quantity in wanted.items():
+        await _record("order", found[sweet_id], -quantity, user_id, sold=quantity)
+    return True, lines
+
+async def reserve_sweet(sweet_id, quantity, user_id):
+    """Hold stock for a user until confirmed, released or expired.
+
+    Returns None if the sweet does not exist; raises InsufficientStock.
+    """
+    sweet = await get_sweet_by_id(sweet_id)
+    taken = sweet and await _take(sweet_id, quantity)
+    if taken is None:
+        return None
+    if not taken:
+        raise InsufficientStock(sweet)
+    _sweet_changed(sweet_id, listings=False)
+    await _record("reserve", sweet, -quantity, user_id)
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=settings.RESERVATION_TTL_SECONDS)
+    # The sweet's name, category and price are kept for the ledger entries
+    # that confirming or releasing write.
+    reservation = await database.reservations.insert({
+        "sweet_id": sweet_id, "user_id": user_id, "quantity": quantity, "expires_at": expires_at,
+        "name": sweet["name"], "category": sweet["category"], "price": sweet["price"],
+    })
+    return _with_id(reservation)
+
+def _reserved_sweet(reservation):
+    return {"_id": reservation["sweet_id"], **{k: reservation[k] for k in ("name", "category", "price")}}
+
+async def confirm_reservation(reservation_id, user_id):
+    # The stock was taken when reserving; confirming only keeps the sweeper
+    # from giving it back.
+    now = datetime.now(timezone.utc)
+    reservation = await database.reservations.pop(reservation_id, user_id, active_at=now)
+    if reservation is not None:
+        await _record("confirm", _reserved_sweet(reservation), 0, user_id, sold=reservation["quantity"])
+    return _with_id(reservation)
+
+async def _give_back(reservation, claimed=False):
+    added = await _add(reservation["sweet_id"], reservation["quantity"])
+    if claimed:
+        # Deleted only once the stock is back: if giving it back failed, the
+        # claim lapses and a later sweep tries again.
+        await database.reservations.delete(reservation["_id"])
+    if added:
+        await _record("release", _reserved_sweet(reservation), reservation["quantity"], reservation["user_id"])
+    _sweet_changed(reservation["sweet_id"], listings=False)
+
+async def release_reservation(reservation_id, user_id):
+    reservation = await database.reservations.pop(reservation_id, user_id)
+    if reservation is None:
+        return False
+    await _give_back(reservation)
+    return True
+
+async def reclaim_expired_reservations():
+    """Return the stock of expired reservations; returns how many there were."""
+    now = datetime.now(timezone.utc)
+    until = now + timedelta(seconds=settings.RESERVATION_CLAIM_SECONDS)
+    reclaimed = 0
+    while (reservation := await database.reservations.claim_expired(now, until)) is not None:
+        await _give_back(reservation, claimed=True)
+        reclaimed += 1
+    return reclaimed
+
+async def sweep_reservations():
+    """Background task; claiming makes each reservation reclaimed by one worker at a time."""
+    while True:
+        try:
+            await reclaim_expired_reservations()
+        except Exception:
+            logger.exception("Could not reclaim expired reservations")
+        await asyncio.sleep(settings.RESERVATION_SWEEP_SECONDS)
+
+async def get_category_stats():
+    return await database.stats.categories()
+
+async def get_top_sellers(by="units_sold", limit=10):
+    return await database.stats.top_sellers(by, limit)
+
+async def get_low_stock(threshold, limit=50):
+    return await database.sweets.low_stock(threshold, limit)
+
+def _row_failed(summary, row, message):
+    summary["failed"] += 1
+    if len(summary["errors"]) < settings.IMPORT_MAX_ERRORS:
+        summary["errors"].append({"row": row, "error": message})
+
+async def _write_batch(summary, docs, rows):
+    inserted, updated, errors = await database.sweets.upsert_many(docs)
+    summary["inserted"] += inserted
+    summary["updated"] += updated
+    for index, message in errors:
+        _row_failed(summary, rows[index], message)
+
+async def import_sweets(parsed_rows):
+    """Upsert parsed rows from bulk.read_sweets in batches and return a summary.
+
+    One batch is written while the next is parsed, so at most two are held.
+    """
+    summary = {"rows": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+    docs, rows = [], []
+    writing = None
+    try:
+        async for row, parsed in parsed_rows:
+            summary["rows"] = row
+            if isinstance(parsed, RowError):
+                _row_failed(summary, row, str(parsed))
+                continue
+            sweet, sweet_id = parsed
+            doc = _normalized(sweet)
+            if sweet_id:
+                doc["_id"] = ObjectId(sweet_id)
+            docs.append(doc)
+            rows.append(row)
+            if len(docs) >= settings.IMPORT_BATCH_SIZE:
+                if writing:
+                    await writing
+                writing = asyncio.create_task(_write_batch(summary, docs, rows))
+                docs, rows = [], []
+        if writing:
+            await writing
+        if docs:
+            await _write_batch(summary, docs, rows)
+    except RowError as exc:
+        summary["aborted"] = str(exc)
+    finally:
+        if writing and not writing.done():
+            await writing
+        cache.invalidate_all()
+        events.resync()
+        # Imports overwrite sweets without reading them, so the category
+        # totals are rebuilt rather than adjusted.
+        await database.stats.reconcile_stock()
+    return summary
+
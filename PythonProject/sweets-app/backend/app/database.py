@@ -1,16 +1,155 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from .config import settings
-
-client: AsyncIOMotorClient | None = None
-db = None
-
-async def connect_to_mongo():
-    global client, db
-    client = AsyncIOMotorClient(settings.MONGO_URL)
-    await client.admin.command('ping')
-    db = client[settings.MONGO_DB_NAME]
-
-async def close_mongo_connection():
-    global client
-    client.close()
-
+import asyncio
+import threading
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import WriteConcern, monitoring
+from pymongo.errors import PyMongoError
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from .config import settings
+from .repository import (
+    MongoLedgerRepository, MongoReservationRepository, MongoStatsRepository, MongoSweetRepository, MongoUserRepository
+)
+
+client: AsyncIOMotorClient | None = None
+db = None
+# db with settings.MONGO_CATALOG_READ_PREFERENCE, for catalog reads.
+catalog_db = None
+supports_transactions = False
+# pymongo monitoring listeners handed to the client, e.g. to count round trips.
+event_listeners = []
+
+# Repositories behind crud.py, chosen by settings.STORAGE_BACKEND.
+users = None
+sweets = None
+reservations = None
+ledger = None
+stats = None
+store = None
+
+def _pool_size():
+    if settings.MONGO_MAX_CONNECTIONS > 0:
+        # serve.py sets WEB_WORKERS for its workers.
+        return max(1, settings.MONGO_MAX_CONNECTIONS // max(1, settings.WEB_WORKERS))
+    return settings.MONGO_MAX_POOL_SIZE
+
+class _OpenedConnections(monitoring.ConnectionPoolListener):
+    """Counts connections opened, so startup can wait for the pool to fill."""
+
+    def __init__(self):
+        self.count = 0
+
+    def connection_ready(self, event):
+        self.count += 1
+
+    def _ignored(self, event):
+        pass
+
+    pool_created = pool_ready = pool_cleared = pool_closed = _ignored
+    connection_created = connection_closed = _ignored
+    connection_check_out_started = connection_check_out_failed = _ignored
+    connection_checked_out = connection_checked_in = _ignored
+
+class _OperationTimes(monitoring.CommandListener):
+    """Keeps the newest cluster time in any reply: writes made by this worker,
+    and those of others seen through change streams."""
+
+    def __init__(self):
+        self.latest = None
+        # The driver calls listeners from Motor's worker threads.
+        self._lock = threading.Lock()
+
+    def succeeded(self, event):
+        operation_time = event.reply.get("operationTime")
+        if operation_time is None:
+            return
+        with self._lock:
+            if self.latest is None or operation_time > self.latest:
+                self.latest = operation_time
+
+    def started(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+operation_times = _OperationTimes()
+
+async def _prewarm(opened, min_pool_size):
+    # The driver opens minPoolSize connections in the background; waiting for
+    # them keeps the handshakes off the first requests after a deploy.
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.MONGO_PREWARM_TIMEOUT_SECONDS
+    while opened.count < min_pool_size and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+
+def _catalog_read_preference():
+    return make_read_preference(
+        read_pref_mode_from_name(settings.MONGO_CATALOG_READ_PREFERENCE),
+        None,
+        settings.MONGO_CATALOG_MAX_STALENESS_SECONDS,
+    )
+
+async def connect_to_mongo():
+    global client, db, catalog_db, supports_transactions
+    pool_size = _pool_size()
+    min_pool_size = min(settings.MONGO_MIN_POOL_SIZE, pool_size)
+    opened = _OpenedConnections()
+    # Left out when unset so compressors in MONGO_URL still apply; unknown or
+    # uninstalled ones are skipped by the driver with a warning.
+    options = {"compressors": settings.MONGO_COMPRESSORS} if settings.MONGO_COMPRESSORS else {}
+    client = AsyncIOMotorClient(
+        settings.MONGO_URL,
+        maxPoolSize=pool_size,
+        minPoolSize=min_pool_size,
+        maxConnecting=settings.MONGO_MAX_CONNECTING,
+        connectTimeoutMS=int(settings.MONGO_CONNECT_TIMEOUT_SECONDS * 1000),
+        serverSelectionTimeoutMS=int(settings.MONGO_SERVER_SELECTION_TIMEOUT_SECONDS * 1000),
+        event_listeners=[*event_listeners, opened, operation_times],
+        **options,
+    )
+    hello = await client.admin.command('hello')
+    # Multi-document transactions need a replica set or a sharded cluster.
+    supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+    db = client[settings.MONGO_DB_NAME]
+    catalog_db = db.with_options(read_preference=_catalog_read_preference())
+    if min_pool_size:
+        await _prewarm(opened, min_pool_size)
+
+async def close_mongo_connection():
+    global client
+    client.close()
+
+async def open_storage():
+    global users, sweets, reservations, ledger, stats, store
+    if settings.STORAGE_BACKEND == "memory":
+        from .memory import MemoryStore
+        store = MemoryStore()
+        users, sweets, reservations, ledger, stats = store.users, store.sweets, store.reservations, store.ledger, store.stats
+        return
+    await connect_to_mongo()
+    # Stock changes are acknowledged only once a majority of the replica set
+    # has them, whatever MONGO_URL asks for, so a failover cannot undo a sale.
+    stock_db = db.with_options(write_concern=WriteConcern(w="majority"))
+    users = MongoUserRepository(db)
+    sweets = MongoSweetRepository(client, stock_db, supports_transactions, catalog_db, lambda: operation_times.latest)
+    reservations = MongoReservationRepository(stock_db)
+    ledger = MongoLedgerRepository(stock_db)
+    stats = MongoStatsRepository(db)
+    await sweets.ensure_indexes()
+    await stats.ensure_indexes()
+
+async def ping(timeout):
+    """Whether storage answers within timeout, using the existing connection pool."""
+    if settings.STORAGE_BACKEND == "memory":
+        return store is not None
+    if client is None:
+        return False
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+    except (TimeoutError, PyMongoError):
+        return False
+    return True
+
+async def close_storage():
+    if settings.STORAGE_BACKEND != "memory":
+        await close_mongo_connection()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import signal
+import threading
+from contextlib import suppress
+
+import orjson
+from pymongo.errors import PyMongoError
+
+from . import database
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+RESYNC = b"event: resync\ndata: {}\n\n"
+KEEPALIVE = b": keepalive\n\n"
+
+class TooManySubscribers(Exception):
+    pass
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = False
+
+class Broadcaster:
+    """Fans encoded Server-Sent Events out to this worker's subscribers.
+
+    Each subscriber has a bounded queue; one that falls queue_size messages
+    behind is dropped and told to resync, so a slow client never holds up
+    the others or grows memory.
+    """
+
+    def __init__(self, max_subscribers, queue_size):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.published = 0
+        self.dropped = 0
+        self.closed = False
+
+    def subscribe(self):
+        if self.closed or len(self.subscribers) >= self.max_subscribers:
+            raise TooManySubscribers()
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, message):
+        self.published += 1
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self.subscribers.discard(subscriber)
+                self.dropped += 1
+
+    def close(self):
+        """End every stream with a resync and refuse new subscribers; clients
+        reconnect, to another worker once this one has stopped listening."""
+        self.closed = True
+        for subscriber in self.subscribers:
+            subscriber.dropped = True
+            # A full queue already wakes its reader.
+            with suppress(asyncio.QueueFull):
+                subscriber.queue.put_nowait(RESYNC)
+        self.subscribers.clear()
+
+    async def stream(self, subscriber):
+        """The response body for one subscriber."""
+        try:
+            yield f"retry: {settings.EVENTS_RETRY_MILLISECONDS}\n\n".encode()
+            while True:
+                if not subscriber.queue.empty():
+                    message = subscriber.queue.get_nowait()
+                else:
+                    try:
+                        message = await asyncio.wait_for(subscriber.queue.get(), settings.EVENTS_KEEPALIVE_SECONDS)
+                    except TimeoutError:
+                        # Keeps proxies from closing an idle connection.
+                        yield KEEPALIVE
+                        continue
+                if subscriber.dropped:
+                    yield RESYNC
+                    return
+                yield message
+        finally:
+            self.unsubscribe(subscriber)
+
+broadcaster = Broadcaster(settings.EVENTS_MAX_SUBSCRIBERS, settings.EVENTS_QUEUE_SIZE)
+
+# Sweets changed since the last publish; a hot sweet bought a thousand times
+# in one interval is read and sent once.
+_changed = set()
+
+def close_on_exit():
+    """Close the broadcaster as soon as uvicorn is told to stop. Event streams
+    never finish by themselves, so the graceful shutdown would otherwise wait
+    its full timeout on them."""
+    # Signal handlers can only be set from the main thread, as uvicorn does.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+        def handle_exit(signum, frame, previous=previous):
+            # Runs between two steps of the event loop; leave the queues to it.
+            loop.call_soon_threadsafe(broadcaster.close)
+            previous(signum, frame)
+        signal.signal(sig, handle_exit)
+
+def sweet_changed(sweet_id):
+    if broadcaster.subscribers:
+        _changed.add(str(sweet_id))
+
+def resync():
+    """Tell every subscriber to refetch, e.g. after a bulk import."""
+    _changed.clear()
+    broadcaster.publish(RESYNC)
+
+async def _publish_changed():
+    sweet_ids = list(_changed)
+    _changed.clear()
+    found = {str(s["_id"]): s for s in await database.sweets.get_many(sweet_ids)}
+    changes = []
+    for sweet_id in sweet_ids:
+        sweet = found.get(sweet_id)
+        if sweet is None:
+            changes.append({"id": sweet_id, "deleted": True})
+        else:
+            changes.append({
+                "id": sweet_id, "name": sweet["name"], "category": sweet["category"],
+                "price": sweet["price"], "quantity": sweet["quantity"],
+            })
+    # Encoded once, however many subscribers there are.
+    broadcaster.publish(b"event: stock\ndata: " + orjson.dumps(changes) + b"\n\n")
+
+async def publish_changes():
+    """Background task; sends the current state of changed sweets every interval."""
+    while True:
+        await asyncio.sleep(settings.EVENTS_COALESCE_SECONDS)
+        if not _changed:
+            continue
+        try:
+            await _publish_changed()
+        except Exception:
+            logger.exception("Could not publish stock changes")
+
+async def watch_changes():
+    """Mark sweets changed by any worker, via a MongoDB change stream."""
+    pipeline = [{"$match": {"ns.coll": {"$in": ["sweets", "stock_shards"]}}}]
+    while True:
+        try:
+            async with database.db.watch(pipeline) as stream:
+                # Changes may have been missed while (re)connecting.
+                resync()
+                async for change in stream:
+                    if "documentKey" in change:
+                        # Sub-counters are keyed "<sweet id>:<n>".
+                        sweet_changed(str(change["documentKey"]["_id"]).split(":")[0])
+        except PyMongoError:
+            logger.exception("Stock change stream failed, retrying")
+            await asyncio.sleep(1)
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+
+from . import analytics, database
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class Ledger:
+    """Append-only inventory ledger written in batches by a background task.
+
+    record() queues an entry and returns; the writer flushes with one
+    insert_many once batch_size entries are pending or flush_seconds after
+    the first, and record() waits while max_pending are queued. Entries are
+    written after the stock change they describe, not atomically with it,
+    and each written batch is added to the analytics rollups.
+
+    Durability is "buffered" (entries still queued are lost if the process
+    dies) or "sync": record() returns once its entry is written, and the
+    writer flushes without waiting, batching whatever queued up while the
+    previous insert_many was in flight. In either mode, entries that fail to
+    write are logged and counted as dropped, and record() does not raise:
+    the stock change they describe has already been made.
+    """
+
+    def __init__(self, batch_size, flush_seconds, max_pending, durability="buffered"):
+        if durability not in ("buffered", "sync"):
+            raise ValueError(f"unknown ledger durability {durability!r}")
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.durability = durability
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self._queue = None
+        self._writer = None
+
+    def start(self):
+        self._queue = asyncio.Queue(self.max_pending)
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything queued so far, then stop the writer."""
+        if self._writer is None:
+            return
+        await self._queue.put(None)
+        await self._writer
+        self._queue = self._writer = None
+
+    async def record(self, entry):
+        if self._writer is None:
+            # Not started (scripts, or after shutdown): write straight through.
+            await self._flush([(entry, None)])
+            return
+        written = asyncio.get_running_loop().create_future() if self.durability == "sync" else None
+        await self._queue.put((entry, written))
+        if written is not None:
+            await written
+
+    async def _next_batch(self):
+        # Returns (batch, stopping) once the batch is full, flush_seconds have
+        # passed since its first entry, or stop() was called.
+        loop = asyncio.get_running_loop()
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = loop.time() + (self.flush_seconds if self.durability == "buffered" else 0)
+        while len(batch) < self.batch_size:
+            if self._queue.empty():
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                except TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+
+    async def _write(self, entries):
+        await database.ledger.insert_many(entries)
+        try:
+            await analytics.roll_up(entries)
+        except Exception:
+            # The entries are in; the next reconcile counts them.
+            logger.exception("Could not add %d ledger entries to the rollups", len(entries))
+
+    async def _flush(self, batch):
+        try:
+            await self._write([entry for entry, _ in batch])
+        except Exception:
+            logger.exception("Could not write %d ledger entries", len(batch))
+            self.dropped += len(batch)
+        else:
+            self.written += len(batch)
+            self.batches += 1
+        for _, written in batch:
+            if written is not None and not written.done():
+                written.set_result(None)
+
+inventory = Ledger(
+    settings.LEDGER_BATCH_SIZE, settings.LEDGER_FLUSH_SECONDS, settings.LEDGER_MAX_PENDING, settings.LEDGER_DURABILITY
+)
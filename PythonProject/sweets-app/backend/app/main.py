@@ -1,104 +1,352 @@
-from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.middleware.cors import CORSMiddleware
-from datetime import timedelta
-
-from .database import connect_to_mongo, close_mongo_connection
-from .schemas import UserCreate, Token, SweetCreate, SweetOut, LoginCredentials
-from .auth import (
-    get_password_hash, verify_password,
-    create_access_token, get_current_active_user, get_admin_user
-)
-from .crud import (
-    create_user, get_user_by_email, create_sweet, list_sweets,
-    search_sweets, update_sweet, delete_sweet,
-    get_sweet_by_id, purchase_sweet, restock_sweet
-)
-from .config import settings
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    await connect_to_mongo()
-    yield
-    await close_mongo_connection()
-
-app = FastAPI(title="Sweets Shop API", lifespan=lifespan)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.post("/api/auth/register", status_code=201)
-async def register(user: UserCreate):
-    existing = await get_user_by_email(user.email)
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = await get_password_hash(user.password)
-    created = await create_user(user.email, hashed, user.is_admin)
-    return {"id": str(created["_id"]), "email": created["email"], "is_admin": created["is_admin"]}
-
-@app.post("/api/auth/login", response_model=Token)
-async def login(credentials: LoginCredentials):
-    user = await get_user_by_email(credentials.email)
-    if not user or not await verify_password(credentials.password, user["hashed_password"]):
-        raise HTTPException(status_code=400, detail="Incorrect email or password")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    token = create_access_token(
-        {"sub": str(user["_id"]), "is_admin": user.get("is_admin", False)},
-        expires_delta=access_token_expires
-    )
-    return {"access_token": token, "token_type": "bearer"}
-
-@app.post("/api/sweets", response_model=SweetOut)
-async def add_sweet(sweet: SweetCreate, current_user=Depends(get_admin_user)):
-    return await create_sweet(sweet)
-
-@app.get("/api/sweets", response_model=list[SweetOut])
-async def get_all_sweets(current_user=Depends(get_current_active_user)):
-    return await list_sweets()
-
-@app.get("/api/sweets/search", response_model=list[SweetOut])
-async def search_all_sweets(
-    name: str | None = None,
-    category: str | None = None,
-    min_price: float | None = None,
-    max_price: float | None = None,
-    current_user=Depends(get_current_active_user)
-):
-    return await search_sweets(name, category, min_price, max_price)
-
-@app.put("/api/sweets/{sweet_id}", response_model=SweetOut)
-async def update_sweet_details(sweet_id: str, sweet: SweetCreate, current_user=Depends(get_admin_user)):
-    updated = await update_sweet(sweet_id, sweet)
-    if not updated:
-        raise HTTPException(status_code=404, detail="Sweet not found")
-    return updated
-
-@app.delete("/api/sweets/{sweet_id}")
-async def delete_sweet_item(sweet_id: str, current_user=Depends(get_admin_user)):
-    deleted = await delete_sweet(sweet_id)
-    if not deleted:
-        raise HTTPException(status_code=404, detail="Sweet not found")
-    return {"message": "Sweet deleted successfully"}
-
-@app.post("/api/sweets/{sweet_id}/purchase")
-async def purchase_sweet_item(sweet_id: str, quantity: int = 1, current_user=Depends(get_current_active_user)):
-    sweet = await get_sweet_by_id(sweet_id)
-    if not sweet:
-        raise HTTPException(status_code=404, detail="Sweet not found")
-    if sweet["quantity"] < quantity:
-        raise HTTPException(status_code=400, detail="Not enough stock")
-    await purchase_sweet(sweet_id, quantity)
-    return {"message": f"Purchased {quantity} of {sweet['name']}"}
-
-@app.post("/api/sweets/{sweet_id}/restock")
-async def restock_sweet_item(sweet_id: str, quantity: int = 1, current_user=Depends(get_admin_user)):
-    sweet = await get_sweet_by_id(sweet_id)
-    if not sweet:
-        raise HTTPException(status_code=404, detail="Sweet not found")
-    await restock_sweet(sweet_id, quantity)
-    return {"message": f"Restocked {quantity} of {sweet['name']}"}
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import Literal
+import orjson
+from bson import ObjectId
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from datetime import timedelta
+
+from . import analytics, cache, database, events, ledger, metrics
+from .bulk import read_sweets, to_csv, to_ndjson
+from .database import open_storage, close_storage
+from .schemas import UserCreate, Token, SweetCreate, SweetOut, LoginCredentials, OrderCreate, ReservationOut
+from .auth import (
+    get_password_hash, verify_password,
+    create_access_token, get_current_active_user, get_admin_user, shutdown_hash_pool,
+    refresh_token_versions, revoke_user_tokens
+)
+from .crud import (
+    create_user, get_user_by_email, get_token_version, create_sweet, list_sweets,
+    search_sweets, update_sweet, delete_sweet, stream_sweets, stream_search_sweets,
+    get_sweet_by_id, purchase_sweet, restock_sweet, checkout, import_sweets, InsufficientStock, InvalidCursor,
+    reserve_sweet, confirm_reservation, release_reservation, sweep_reservations, split_stock,
+    get_category_stats, get_top_sellers, get_low_stock, get_facets
+)
+from .config import settings
+
+# Fields a search's q can be scoped to.
+SearchField = Literal["name", "category"]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_storage()
+    ledger.inventory.start()
+    events.close_on_exit()
+    background = [asyncio.create_task(refresh_token_versions()), asyncio.create_task(sweep_reservations())]
+    background.append(asyncio.create_task(events.publish_changes()))
+    if settings.EVENTS_CHANGE_STREAM and settings.STORAGE_BACKEND == "mongo":
+        background.append(asyncio.create_task(events.watch_changes()))
+    if settings.ANALYTICS_RECONCILE_SECONDS > 0:
+        background.append(asyncio.create_task(analytics.reconcile_periodically()))
+    if settings.CACHE_CHANGE_STREAM and settings.STORAGE_BACKEND == "mongo":
+        background.append(asyncio.create_task(cache.watch_catalog_changes()))
+    yield
+    for task in background:
+        task.cancel()
+    for task in background:
+        with suppress(asyncio.CancelledError):
+            await task
+    # After the background tasks, which may still record stock changes.
+    await ledger.inventory.stop()
+    shutdown_hash_pool()
+    await close_storage()
+
+app = FastAPI(title="Sweets Shop API", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
+)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    database.event_listeners.append(metrics.MongoCommandListener())
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request, exc):
+    return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return orjson.dumps(content)
+
+def _validators():
+    # The tag is taken before reading so a concurrent write can only make it
+    # look older than the body, never newer.
+    return {"ETag": cache.etag(), "Cache-Control": "private, no-cache"}
+
+def _not_modified(request, headers):
+    candidates = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if headers["ETag"] in candidates or "*" in candidates:
+        return Response(status_code=304, headers=headers)
+    return None
+
+def _listing(page, headers):
+    # Listings come from the repositories already in SweetOut's shape, so they
+    # are encoded as they are instead of being validated against the model again.
+    sweets, next_cursor = page
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return FastJSONResponse(sweets, headers=headers)
+
+@app.post("/api/auth/register", status_code=201)
+async def register(user: UserCreate):
+    existing = await get_user_by_email(user.email)
+    if existing:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    hashed = await get_password_hash(user.password)
+    created = await create_user(user.email, hashed, user.is_admin)
+    return {"id": str(created["_id"]), "email": created["email"], "is_admin": created["is_admin"]}
+
+@app.post("/api/auth/login", response_model=Token)
+async def login(credentials: LoginCredentials):
+    user = await get_user_by_email(credentials.email)
+    if not user or not await verify_password(credentials.password, user["hashed_password"]):
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    user_id = str(user["_id"])
+    token = create_access_token(
+        {"sub": user_id, "is_admin": user.get("is_admin", False), "ver": await get_token_version(user_id)},
+        expires_delta=access_token_expires
+    )
+    return {"access_token": token, "token_type": "bearer"}
+
+@app.post("/api/auth/logout")
+async def logout(current_user=Depends(get_current_active_user)):
+    await revoke_user_tokens(str(current_user["_id"]))
+    return {"message": "Logged out"}
+
+@app.post("/api/sweets", response_model=SweetOut)
+async def add_sweet(sweet: SweetCreate, current_user=Depends(get_admin_user)):
+    return await create_sweet(sweet)
+
+@app.get("/api/sweets", response_model=list[SweetOut])
+async def get_all_sweets(
+    request: Request,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    format: Literal["json", "ndjson"] = "json",
+    current_user=Depends(get_current_active_user)
+):
+    if format == "ndjson":
+        return StreamingResponse(to_ndjson(stream_sweets(cursor, limit)), media_type="application/x-ndjson")
+    headers = _validators()
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    return _listing(await list_sweets(cursor, limit or 100), headers)
+
+@app.get("/api/sweets/search", response_model=list[SweetOut])
+async def search_all_sweets(
+    request: Request,
+    name: str | None = None,
+    category: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    q: str | None = None,
+    fields: list[SearchField] | None = Query(None),
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=1000),
+    format: Literal["json", "ndjson"] = "json",
+    current_user=Depends(get_current_active_user)
+):
+    """name, category and the price range must all match; q matches sweets
+    whose name or category (or only the given fields) start with it."""
+    if format == "ndjson":
+        sweets = stream_search_sweets(name, category, min_price, max_price, cursor, limit, q, fields)
+        return StreamingResponse(to_ndjson(sweets), media_type="application/x-ndjson")
+    headers = _validators()
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    return _listing(await search_sweets(name, category, min_price, max_price, cursor, limit or 100, q, fields), headers)
+
+@app.get("/api/sweets/facets")
+async def sweet_facets(
+    request: Request,
+    name: str | None = None,
+    category: str | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    q: str | None = None,
+    fields: list[SearchField] | None = Query(None),
+    current_user=Depends(get_current_active_user)
+):
+    """Category counts, price histogram and in-stock count for the sweets a
+    search with the same filters would return."""
+    headers = _validators()
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    return FastJSONResponse(await get_facets(name, category, min_price, max_price, q, fields), headers=headers)
+
+@app.get("/api/sweets/events")
+async def sweet_events(current_user=Depends(get_current_active_user)):
+    """Server-Sent Events: "stock" carries a JSON list of changed sweets, or
+    {"id", "deleted": true}; "resync" means refetch, as changes were missed."""
+    try:
+        subscriber = events.broadcaster.subscribe()
+    except events.TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many event subscribers")
+    return StreamingResponse(
+        events.broadcaster.stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/sweets/export")
+async def export_catalog(format: Literal["csv", "ndjson"] = "ndjson", current_user=Depends(get_admin_user)):
+    sweets = stream_sweets()
+    body, media_type = (to_csv(sweets), "text/csv") if format == "csv" else (to_ndjson(sweets), "application/x-ndjson")
+    return StreamingResponse(
+        body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="sweets.{format}"'}
+    )
+
+@app.post("/api/sweets/import")
+async def import_catalog(
+    request: Request,
+    format: Literal["csv", "ndjson"] | None = None,
+    current_user=Depends(get_admin_user)
+):
+    # The body is parsed as it arrives, never read into memory whole.
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    summary = await import_sweets(read_sweets(request.stream(), format))
+    if "aborted" in summary:
+        raise HTTPException(status_code=400, detail=summary)
+    return summary
+
+@app.get("/api/sweets/{sweet_id}", response_model=SweetOut)
+async def get_sweet(sweet_id: str, request: Request, response: Response, current_user=Depends(get_current_active_user)):
+    headers = _validators()
+    not_modified = _not_modified(request, headers)
+    if not_modified:
+        return not_modified
+    response.headers.update(headers)
+    sweet = await get_sweet_by_id(sweet_id) if ObjectId.is_valid(sweet_id) else None
+    if not sweet:
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    return sweet
+
+@app.put("/api/sweets/{sweet_id}", response_model=SweetOut)
+async def update_sweet_details(sweet_id: str, sweet: SweetCreate, current_user=Depends(get_admin_user)):
+    updated = await update_sweet(sweet_id, sweet) if ObjectId.is_valid(sweet_id) else None
+    if not updated:
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    return updated
+
+@app.delete("/api/sweets/{sweet_id}")
+async def delete_sweet_item(sweet_id: str, current_user=Depends(get_admin_user)):
+    deleted = ObjectId.is_valid(sweet_id) and await delete_sweet(sweet_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    return {"message": "Sweet deleted successfully"}
+
+@app.post("/api/sweets/{sweet_id}/purchase")
+async def purchase_sweet_item(sweet_id: str, quantity: int = Query(1, gt=0), current_user=Depends(get_current_active_user)):
+    try:
+        sweet = await purchase_sweet(sweet_id, quantity, str(current_user["_id"])) if ObjectId.is_valid(sweet_id) else None
+    except InsufficientStock:
+        raise HTTPException(status_code=400, detail="Not enough stock")
+    if not sweet:
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    return {"message": f"Purchased {quantity} of {sweet['name']}"}
+
+@app.post("/api/orders")
+async def place_order(order: OrderCreate, current_user=Depends(get_current_active_user)):
+    placed, lines = await checkout(((line.sweet_id, line.quantity) for line in order.items), str(current_user["_id"]))
+    if not placed:
+        raise HTTPException(status_code=409, detail={"message": "Order could not be fulfilled", "lines": lines})
+    return {"message": f"Purchased {sum(line['quantity'] for line in lines)} sweets", "lines": lines}
+
+@app.post("/api/sweets/{sweet_id}/restock")
+async def restock_sweet_item(sweet_id: str, quantity: int = 1, current_user=Depends(get_admin_user)):
+    sweet = await get_sweet_by_id(sweet_id) if ObjectId.is_valid(sweet_id) else None
+    if not sweet:
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    await restock_sweet(sweet_id, quantity, str(current_user["_id"]))
+    return {"message": f"Restocked {quantity} of {sweet['name']}"}
+
+@app.post("/api/sweets/{sweet_id}/reserve", response_model=ReservationOut, status_code=status.HTTP_201_CREATED)
+async def reserve_sweet_item(sweet_id: str, quantity: int = Query(1, gt=0), current_user=Depends(get_current_active_user)):
+    try:
+        reservation = await reserve_sweet(sweet_id, quantity, str(current_user["_id"])) if ObjectId.is_valid(sweet_id) else None
+    except InsufficientStock:
+        raise HTTPException(status_code=400, detail="Not enough stock")
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    return reservation
+
+@app.post("/api/reservations/{reservation_id}/confirm", response_model=ReservationOut)
+async def confirm_reservation_item(reservation_id: str, current_user=Depends(get_current_active_user)):
+    reservation = None
+    if ObjectId.is_valid(reservation_id):
+        reservation = await confirm_reservation(reservation_id, str(current_user["_id"]))
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found or expired")
+    return reservation
+
+@app.delete("/api/reservations/{reservation_id}")
+async def release_reservation_item(reservation_id: str, current_user=Depends(get_current_active_user)):
+    released = ObjectId.is_valid(reservation_id) and await release_reservation(reservation_id, str(current_user["_id"]))
+    if not released:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return {"message": "Reservation released"}
+
+@app.post("/api/sweets/{sweet_id}/shards")
+async def split_sweet_stock(sweet_id: str, count: int = Query(..., ge=1, le=64), current_user=Depends(get_admin_user)):
+    """Spread a hot sweet's stock over `count` counters; 1 merges them back."""
+    if not (ObjectId.is_valid(sweet_id) and await split_stock(sweet_id, count)):
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    return {"message": f"Stock split over {count} counters"}
+
+@app.get("/api/admin/stats/categories")
+async def category_stats(current_user=Depends(get_admin_user)):
+    return await get_category_stats()
+
+@app.get("/api/admin/stats/top-sellers")
+async def top_sellers(
+    by: Literal["units_sold", "revenue"] = "units_sold",
+    limit: int = Query(10, ge=1, le=100),
+    current_user=Depends(get_admin_user),
+):
+    return await get_top_sellers(by, limit)
+
+@app.get("/api/admin/stats/low-stock", response_model=list[SweetOut])
+async def low_stock(
+    threshold: int = Query(5, ge=0), limit: int = Query(50, ge=1, le=1000), current_user=Depends(get_admin_user)
+):
+    return await get_low_stock(threshold, limit)
+
+@app.post("/api/admin/stats/reconcile")
+async def reconcile_stats(current_user=Depends(get_admin_user)):
+    await analytics.reconcile()
+    return {"message": "Analytics rebuilt"}
+
+@app.get("/api/admin/cache")
+async def cache_stats(current_user=Depends(get_admin_user)):
+    return cache.catalog.stats()
+
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    # Never touches storage: a database outage should not get every worker
+    # restarted, only taken out of rotation by /health/ready.
+    return {"status": "ok"}
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    if not await database.ping(settings.HEALTH_TIMEOUT_SECONDS):
+        raise HTTPException(status_code=503, detail="Storage unavailable")
+    return {"status": "ready"}
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render({"catalog": cache.catalog}), media_type="text/plain; version=0.0.4")
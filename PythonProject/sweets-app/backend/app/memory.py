@@ -0,0 +1,532 @@
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+
+from bson import ObjectId
+
+from . import metrics
+from .repository import (
+    CATEGORY_STATS, LISTED_FIELDS, LedgerRepository, ReservationRepository, StatsRepository, SweetRepository,
+    UserRepository,
+)
+
+# Sorts after every ObjectId's bytes, so (key, _MAX_ID) bounds all entries for key.
+_MAX_ID = b"\xff" * 12
+
+def _copy(doc):
+    return dict(doc) if doc is not None else None
+
+def _listed(doc):
+    listed = {"id": str(doc["_id"])}
+    for field in LISTED_FIELDS:
+        listed[field] = doc[field]
+    return listed
+
+def _extend_sorted(entries, new):
+    new.sort()
+    # Appending past the end (ascending ids, say) needs no merge.
+    if entries and new and new[0] < entries[-1]:
+        entries.extend(new)
+        entries.sort()
+    else:
+        entries.extend(new)
+
+class _SortedIndex:
+    """Sorted (key, _id bytes, _id) entries supporting range and prefix scans.
+
+    The raw bytes break ties between equal keys with a C-level comparison
+    instead of ObjectId.__lt__, which dominates sorting large batches.
+    """
+
+    def __init__(self):
+        self._entries = []
+
+    def add(self, key, doc_id):
+        insort(self._entries, (key, doc_id.binary, doc_id))
+
+    def extend(self, entries):
+        _extend_sorted(self._entries, [(key, doc_id.binary, doc_id) for key, doc_id in entries])
+
+    def remove(self, key, doc_id):
+        entry = (key, doc_id.binary, doc_id)
+        i = bisect_left(self._entries, entry)
+        if i < len(self._entries) and self._entries[i] == entry:
+            del self._entries[i]
+
+    def range(self, low=None, high=None):
+        start = 0 if low is None else bisect_left(self._entries, (low,))
+        end = len(self._entries) if high is None else bisect_right(self._entries, (high, _MAX_ID))
+        return start, end
+
+    def prefix(self, prefix):
+        start = bisect_left(self._entries, (prefix,))
+        # Every key with this prefix sorts before prefix + U+10FFFF.
+        end = bisect_left(self._entries, (prefix + "\U0010ffff",))
+        return start, end
+
+    def ids(self, bounds):
+        start, end = bounds
+        return (doc_id for _, _, doc_id in self._entries[start:end])
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self, store):
+        self.store = store
+        self._users = {}
+        self._by_email = {}
+        self._token_versions = {}
+
+    async def insert(self, doc):
+        await self.store.round_trip()
+        doc.setdefault("_id", ObjectId())
+        self._users[doc["_id"]] = _copy(doc)
+        self._by_email[doc["email"]] = doc["_id"]
+        return doc
+
+    async def get(self, user_id):
+        await self.store.round_trip()
+        return _copy(self._users.get(ObjectId(user_id)))
+
+    async def get_by_email(self, email):
+        await self.store.round_trip()
+        user_id = self._by_email.get(email)
+        return _copy(self._users[user_id]) if user_id else None
+
+    async def delete(self, user_id):
+        await self.store.round_trip()
+        doc = self._users.pop(ObjectId(user_id), None)
+        if doc is None:
+            return False
+        self._by_email.pop(doc["email"], None)
+        return True
+
+    async def token_version(self, user_id):
+        await self.store.round_trip()
+        return self._token_versions.get(user_id, 0)
+
+    async def token_versions(self):
+        await self.store.round_trip()
+        return dict(self._token_versions)
+
+    async def bump_token_version(self, user_id, expires_at):
+        # Kept for the life of the process; there are no TTL deletes in memory.
+        await self.store.round_trip()
+        self._token_versions[user_id] = self._token_versions.get(user_id, 0) + 1
+        return self._token_versions[user_id]
+
+class MemoryLedgerRepository(LedgerRepository):
+    def __init__(self, store):
+        self.store = store
+        self.entries = []
+
+    async def insert_many(self, entries):
+        await self.store.round_trip()
+        self.entries.extend(_copy(entry) for entry in entries)
+
+class MemoryStatsRepository(StatsRepository):
+    def __init__(self, store):
+        self.store = store
+        self._categories = {}
+        self._sweets = {}
+
+    async def add(self, categories, sweets):
+        await self.store.round_trip()
+        for category, increments in categories.items():
+            totals = self._categories.setdefault(category, dict.fromkeys(CATEGORY_STATS, 0))
+            for field, increment in increments.items():
+                totals[field] += increment
+        for sweet_id, (name, category, units_sold, revenue) in sweets.items():
+            stats = self._sweets.setdefault(sweet_id, {"units_sold": 0, "revenue": 0})
+            stats.update(name=name, category=category)
+            stats["units_sold"] += units_sold
+            stats["revenue"] += revenue
+
+    async def categories(self):
+        await self.store.round_trip()
+        return [{"category": category, **self._categories[category]} for category in sorted(self._categories)]
+
+    async def top_sellers(self, by, limit):
+        await self.store.round_trip()
+        ranked = sorted(self._sweets.items(), key=lambda item: item[1][by], reverse=True)[:limit]
+        return [
+            {"id": str(sweet_id), **{field: stats[field] for field in ("name", "category", "units_sold", "revenue")}}
+            for sweet_id, stats in ranked
+        ]
+
+    async def reconcile_stock(self):
+        await self.store.round_trip()
+        for totals in self._categories.values():
+            totals.update(sweets=0, stock=0, stock_value=0)
+        sweets = self.store.sweets
+        for doc in sweets._sweets.values():
+            quantity = doc["quantity"] + sum(sweets._shards.get(doc["_id"], ()))
+            totals = self._categories.setdefault(doc["category"], dict.fromkeys(CATEGORY_STATS, 0))
+            totals["sweets"] += 1
+            totals["stock"] += quantity
+            totals["stock_value"] += quantity * doc["price"]
+
+    async def reconcile_sales(self):
+        await self.store.round_trip()
+        sold = [entry for entry in self.store.ledger.entries if entry["sold"]]
+        for stats in self._sweets.values():
+            stats.update(units_sold=0, revenue=0)
+        for totals in self._categories.values():
+            totals.update(units_sold=0, revenue=0)
+        for entry in sold:
+            revenue = entry["sold"] * entry["price"]
+            stats = self._sweets.setdefault(entry["sweet_id"], {"units_sold": 0, "revenue": 0})
+            stats.update(name=entry["name"], category=entry["category"])
+            stats["units_sold"] += entry["sold"]
+            stats["revenue"] += revenue
+            totals = self._categories.setdefault(entry["category"], dict.fromkeys(CATEGORY_STATS, 0))
+            totals["units_sold"] += entry["sold"]
+            totals["revenue"] += revenue
+
+class MemoryReservationRepository(ReservationRepository):
+    def __init__(self, store):
+        self.store = store
+        self._reservations = {}
+
+    async def insert(self, doc):
+        await self.store.round_trip()
+        doc.setdefault("_id", ObjectId())
+        self._reservations[doc["_id"]] = _copy(doc)
+        return doc
+
+    async def pop(self, reservation_id, user_id, active_at=None):
+        await self.store.round_trip()
+        doc = self._reservations.get(ObjectId(reservation_id))
+        if doc is None or doc["user_id"] != user_id or "claimed_until" in doc:
+            return None
+        if active_at is not None and doc["expires_at"] <= active_at:
+            return None
+        return self._reservations.pop(doc["_id"])
+
+    async def claim_expired(self, now, until):
+        await self.store.round_trip()
+        for doc in self._reservations.values():
+            if doc["expires_at"] <= now and doc.get("claimed_until", now) <= now:
+                doc["claimed_until"] = until
+                return _copy(doc)
+        return None
+
+    async def delete(self, reservation_id):
+        await self.store.round_trip()
+        self._reservations.pop(ObjectId(reservation_id), None)
+
+class MemorySweetRepository(SweetRepository):
+    """Sweets held in a dict with sorted secondary indexes."""
+
+    def __init__(self, store):
+        self.store = store
+        self._sweets = {}
+        # Sub-counters 1..N-1 of split sweets; counter 0 is the doc's quantity.
+        self._shards = {}
+        self._ids = []
+        self._by_price = _SortedIndex()
+        self._by_name = _SortedIndex()
+        self._by_category = _SortedIndex()
+
+    def _index(self, doc):
+        self._by_price.add(doc["price"], doc["_id"])
+        self._by_name.add(doc["name_lower"], doc["_id"])
+        self._by_category.add(doc["category_lower"], doc["_id"])
+
+    def _index_many(self, docs):
+        self._by_price.extend((doc["price"], doc["_id"]) for doc in docs)
+        self._by_name.extend((doc["name_lower"], doc["_id"]) for doc in docs)
+        self._by_category.extend((doc["category_lower"], doc["_id"]) for doc in docs)
+
+    def _unindex(self, doc):
+        self._by_price.remove(doc["price"], doc["_id"])
+        self._by_name.remove(doc["name_lower"], doc["_id"])
+        self._by_category.remove(doc["category_lower"], doc["_id"])
+
+    def _lookup(self, sweet_id):
+        return self._sweets.get(ObjectId(sweet_id))
+
+    def _with_total(self, doc):
+        doc = _copy(doc)
+        if doc is not None and doc["_id"] in self._shards:
+            doc["quantity"] += sum(self._shards[doc["_id"]])
+        return doc
+
+    def _listing(self, doc):
+        listed = _listed(doc)
+        if doc["_id"] in self._shards:
+            listed["quantity"] += sum(self._shards[doc["_id"]])
+        return listed
+
+    def _drop_shards(self, doc):
+        # Written quantities replace split stock.
+        doc.pop("stock_shards", None)
+        self._shards.pop(doc["_id"], None)
+
+    async def insert(self, doc):
+        await self.store.round_trip()
+        doc.setdefault("_id", ObjectId())
+        stored = _copy(doc)
+        self._sweets[doc["_id"]] = stored
+        insort(self._ids, doc["_id"])
+        self._index(stored)
+        return doc
+
+    async def insert_many(self, docs):
+        await self.store.round_trip()
+        stored = []
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            stored.append(_copy(doc))
+        self._sweets.update((doc["_id"], doc) for doc in stored)
+        _extend_sorted(self._ids, [doc["_id"] for doc in stored])
+        self._index_many(stored)
+        return [doc["_id"] for doc in stored]
+
+    def _by_name_lower(self, name_lower):
+        return next(self._by_name.ids(self._by_name.range(name_lower, name_lower)), None)
+
+    async def upsert_many(self, docs):
+        await self.store.round_trip()
+        inserted = {}
+        # Names inserted by this batch, which are not in the indexes yet.
+        new_names = {}
+        updated = 0
+        for doc in docs:
+            if "_id" in doc:
+                doc_id = doc["_id"]
+            else:
+                doc_id = new_names.get(doc["name_lower"]) or self._by_name_lower(doc["name_lower"])
+            existing = self._sweets.get(doc_id)
+            if existing is None:
+                stored = {"_id": doc_id or ObjectId(), **doc}
+                self._sweets[stored["_id"]] = stored
+                inserted[stored["_id"]] = stored
+                new_names.setdefault(stored["name_lower"], stored["_id"])
+            elif doc_id in inserted:
+                existing.update(doc)
+                updated += 1
+            else:
+                self._unindex(existing)
+                self._drop_shards(existing)
+                existing.update(doc)
+                self._index(existing)
+                updated += 1
+        # Indexed as one batch, which keeps large imports from re-sorting per row.
+        _extend_sorted(self._ids, list(inserted))
+        self._index_many(inserted.values())
+        return len(inserted), updated, []
+
+    async def get(self, sweet_id):
+        await self.store.round_trip()
+        return self._with_total(self._lookup(sweet_id))
+
+    async def get_many(self, sweet_ids):
+        await self.store.round_trip()
+        found = (self._lookup(i) for i in sweet_ids)
+        return [self._with_total(doc) for doc in found if doc is not None]
+
+    def _matches(self, doc, query):
+        return (
+            (query.name is None or doc["name_lower"].startswith(query.name))
+            and (query.category is None or doc["category_lower"].startswith(query.category))
+            and (query.text is None or any(doc[f"{field}_lower"].startswith(query.text) for field in query.text_fields))
+            and (query.min_price is None or doc["price"] >= query.min_price)
+            and (query.max_price is None or doc["price"] <= query.max_price)
+        )
+
+    def _plan(self, query, after):
+        # Scan the narrowest index range, like a query planner picking one
+        # index, and filter the rest of the predicates per document.
+        candidates = []
+        if query.name is not None:
+            candidates.append([(self._by_name, self._by_name.prefix(query.name))])
+        if query.category is not None:
+            candidates.append([(self._by_category, self._by_category.prefix(query.category))])
+        if query.min_price is not None or query.max_price is not None:
+            candidates.append([(self._by_price, self._by_price.range(query.min_price, query.max_price))])
+        if query.text is not None:
+            # An $or is planned as the union of one range per field.
+            indexes = {"name": self._by_name, "category": self._by_category}
+            candidates.append([(indexes[f], indexes[f].prefix(query.text)) for f in query.text_fields])
+        if not candidates:
+            start = 0 if after is None else bisect_right(self._ids, after)
+            return (self._ids[i] for i in range(start, len(self._ids)))
+        ranges = min(candidates, key=lambda c: sum(bounds[1] - bounds[0] for _, bounds in c))
+        ids = sorted({doc_id for index, bounds in ranges for doc_id in index.ids(bounds) if after is None or doc_id > after})
+        return iter(ids)
+
+    def _select(self, query, after, limit):
+        selected = []
+        for doc_id in self._plan(query, after):
+            doc = self._sweets.get(doc_id)
+            if doc is not None and self._matches(doc, query):
+                selected.append(doc)
+                if limit and len(selected) >= limit:
+                    break
+        return selected
+
+    async def find(self, query, after=None, limit=None):
+        await self.store.round_trip()
+        return [self._listing(doc) for doc in self._select(query, after, limit)]
+
+    async def stream(self, query, after=None, limit=None):
+        # Pages through the ids like a server-side cursor handing out batches.
+        batch_size = 1000
+        sent = 0
+        while True:
+            size = batch_size if not limit else min(batch_size, limit - sent)
+            await self.store.round_trip()
+            selected = self._select(query, after, size)
+            batch = [self._listing(doc) for doc in selected]
+            for doc in batch:
+                yield doc
+            sent += len(batch)
+            if len(batch) < size or (limit and sent >= limit):
+                return
+            after = selected[-1]["_id"]
+
+    async def low_stock(self, threshold, limit):
+        await self.store.round_trip()
+        listed = (self._listing(doc) for doc in self._sweets.values())
+        return sorted((s for s in listed if s["quantity"] <= threshold), key=lambda s: (s["quantity"], s["id"]))[:limit]
+
+    async def facets(self, query, price_boundaries, max_categories):
+        await self.store.round_trip()
+        total = in_stock = 0
+        categories = {}
+        # Below the lowest boundary, then one per boundary; the last is open-ended.
+        prices = [0] * (len(price_boundaries) + 1)
+        for doc in self._select(query, None, None):
+            total += 1
+            in_stock += doc["quantity"] + sum(self._shards.get(doc["_id"], ())) > 0
+            category, count = categories.get(doc["category_lower"], (doc["category"], 0))
+            categories[doc["category_lower"]] = (category, count + 1)
+            prices[bisect_right(price_boundaries, doc["price"])] += 1
+        ranked = sorted(categories.items(), key=lambda item: (-item[1][1], item[0]))[:max_categories]
+        lows = [None, *price_boundaries]
+        uppers = [*price_boundaries, None]
+        return {
+            "total": total,
+            "in_stock": in_stock,
+            "categories": [{"category": category, "count": count} for _, (category, count) in ranked],
+            "prices": [
+                {"min": low, "max": high, "count": count}
+                for low, high, count in zip(lows, uppers, prices) if count
+            ],
+        }
+
+    async def replace(self, sweet_id, fields):
+        await self.store.round_trip()
+        doc = self._lookup(sweet_id)
+        if doc is None:
+            return None
+        self._unindex(doc)
+        self._drop_shards(doc)
+        doc.update(_copy(fields))
+        self._index(doc)
+        return _copy(doc)
+
+    def _delete(self, sweet_id):
+        doc = self._sweets.pop(ObjectId(sweet_id), None)
+        if doc is None:
+            return False
+        self._unindex(doc)
+        self._shards.pop(doc["_id"], None)
+        del self._ids[bisect_left(self._ids, doc["_id"])]
+        return True
+
+    async def delete(self, sweet_id):
+        await self.store.round_trip()
+        return self._delete(sweet_id)
+
+    async def delete_many(self, sweet_ids):
+        await self.store.round_trip()
+        return sum(self._delete(i) for i in sweet_ids)
+
+    async def take(self, sweet_id, quantity):
+        await self.store.round_trip()
+        doc = self._lookup(sweet_id)
+        if doc is None:
+            return None
+        before = _copy(doc)
+        if doc["quantity"] >= quantity:
+            doc["quantity"] -= quantity
+        return before
+
+    async def add(self, sweet_id, quantity):
+        await self.store.round_trip()
+        doc = self._lookup(sweet_id)
+        if doc is None:
+            return False
+        doc["quantity"] += quantity
+        return True
+
+    async def take_many(self, wanted):
+        await self.store.round_trip()
+        docs = [(self._lookup(i), q) for i, q in wanted.items()]
+        if any(doc is None or doc["quantity"] < q for doc, q in docs):
+            return False
+        for doc, q in docs:
+            doc["quantity"] -= q
+        return True
+
+    async def split_stock(self, sweet_id, shards):
+        await self.store.round_trip()
+        doc = self._lookup(sweet_id)
+        if doc is None:
+            return False
+        doc["quantity"] += sum(self._shards.pop(doc["_id"], ()))
+        doc.pop("stock_shards", None)
+        if shards > 1:
+            share = doc["quantity"] // shards
+            doc["stock_shards"] = shards
+            doc["quantity"] -= share * (shards - 1)
+            self._shards[doc["_id"]] = [share] * (shards - 1)
+        return True
+
+    async def take_sharded(self, sweet_id, quantity, shards):
+        await self.store.round_trip()
+        doc = self._lookup(sweet_id)
+        if doc is None:
+            return None
+        counters = self._shards.get(doc["_id"], [])
+        if doc["quantity"] + sum(counters) < quantity:
+            return False
+        taken = min(doc["quantity"], quantity)
+        doc["quantity"] -= taken
+        for i, held in enumerate(counters):
+            counters[i] -= min(held, quantity - taken)
+            taken += held - counters[i]
+        return True
+
+    async def add_sharded(self, sweet_id, quantity, shards):
+        await self.store.round_trip()
+        doc = self._lookup(sweet_id)
+        if doc is None:
+            return False
+        counters = self._shards.get(doc["_id"], [])
+        share = quantity // (len(counters) + 1)
+        for i in range(len(counters)):
+            counters[i] += share
+        doc["quantity"] += quantity - share * len(counters)
+        return True
+
+class MemoryStore:
+    """In-process storage engine for load testing and profiling without MongoDB.
+
+    ``operations`` counts calls that would each be a round trip to MongoDB.
+    """
+
+    def __init__(self):
+        self.operations = 0
+        self.users = MemoryUserRepository(self)
+        self.sweets = MemorySweetRepository(self)
+        self.reservations = MemoryReservationRepository(self)
+        self.ledger = MemoryLedgerRepository(self)
+        self.stats = MemoryStatsRepository(self)
+
+    async def round_trip(self):
+        # Yield to the event loop like a network call would, so concurrent
+        # requests interleave the way they do against a real server. The
+        # operation itself then runs without awaiting, which keeps it atomic.
+        self.operations += 1
+        metrics.count_round_trip()
+        await asyncio.sleep(0)
@@ -0,0 +1,196 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Prometheus-style histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        # Mongo command events arrive on Motor's executor threads.
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(series):
+            pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket = ",".join(pairs + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket}}} {cumulative}")
+            suffix = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+request_latency = Histogram(
+    "sweets_http_request_duration_seconds", "Request latency by route.", ("method", "route", "status")
+)
+request_round_trips = Histogram(
+    "sweets_http_request_db_round_trips", "Storage round trips per request.", ("route",), COUNT_BUCKETS
+)
+db_commands = Histogram("sweets_db_command_duration_seconds", "MongoDB command latency.", ("command",))
+spans = Histogram("sweets_span_duration_seconds", "Time spent in instrumented sections.", ("span",))
+in_progress = 0
+
+class Trace:
+    """Where one request's time went."""
+
+    __slots__ = ("db_calls", "db_seconds", "spans", "db_in_spans")
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+        # Mongo time already counted by a span such as user_lookup.
+        self.db_in_spans = 0.0
+
+    def breakdown(self, total):
+        parts = {"db": self.db_seconds - self.db_in_spans, **self.spans}
+        # Routing, validation, endpoint code and response serialization.
+        parts["app"] = max(0.0, total - sum(parts.values()))
+        return {name: round(seconds * 1000, 2) for name, seconds in parts.items()}
+
+_current = contextvars.ContextVar("trace", default=None)
+
+class span:
+    """Times a block into the current request's trace and the span histogram."""
+
+    __slots__ = ("name", "trace", "started", "db_seconds")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.trace = _current.get()
+        if self.trace is not None:
+            self.db_seconds = self.trace.db_seconds
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.trace is None:
+            return
+        elapsed = time.perf_counter() - self.started
+        self.trace.spans[self.name] = self.trace.spans.get(self.name, 0.0) + elapsed
+        self.trace.db_in_spans += self.trace.db_seconds - self.db_seconds
+        spans.observe(elapsed, (self.name,))
+
+def count_round_trip():
+    # For storage engines without command monitoring (the in-memory one).
+    trace = _current.get()
+    if trace is not None:
+        trace.db_calls += 1
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Attributes MongoDB commands to the request that sent them.
+
+    Motor copies the caller's context onto its executor threads, so the
+    request's trace is visible here.
+    """
+
+    def started(self, event):
+        pass
+
+    def _finished(self, event):
+        seconds = event.duration_micros / 1e6
+        db_commands.observe(seconds, (event.command_name,))
+        trace = _current.get()
+        if trace is not None:
+            trace.db_calls += 1
+            trace.db_seconds += seconds
+
+    succeeded = _finished
+    failed = _finished
+
+class MetricsMiddleware:
+    """Records per-route latency and round trips, and logs slow requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global in_progress
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace = Trace()
+        token = _current.set(trace)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_progress -= 1
+            _current.reset(token)
+            route = scope.get("route")
+            # The template, not the raw path, keeps the label set bounded.
+            route = getattr(route, "path", "unmatched")
+            request_latency.observe(elapsed, (scope["method"], route, str(status)))
+            request_round_trips.observe(trace.db_calls, (route,))
+            if settings.SLOW_REQUEST_SECONDS and elapsed >= settings.SLOW_REQUEST_SECONDS:
+                logger.warning(
+                    "Slow request %s %s -> %s in %.1f ms, %d round trips: %s",
+                    scope["method"], scope["path"], status, elapsed * 1000, trace.db_calls, trace.breakdown(elapsed),
+                )
+
+def render(caches=None):
+    lines = []
+    for histogram in (request_latency, request_round_trips, db_commands, spans):
+        lines.extend(histogram.render())
+    lines += [
+        "# HELP sweets_http_requests_in_progress Requests being served.",
+        "# TYPE sweets_http_requests_in_progress gauge",
+        f"sweets_http_requests_in_progress {in_progress}",
+    ]
+    stats = {name: cache.stats() for name, cache in (caches or {}).items()}
+    for field, kind, metric in (
+        ("hits", "counter", "sweets_cache_hits_total"),
+        ("misses", "counter", "sweets_cache_misses_total"),
+        ("coalesced", "counter", "sweets_cache_coalesced_total"),
+        ("evictions", "counter", "sweets_cache_evictions_total"),
+        ("invalidations", "counter", "sweets_cache_invalidations_total"),
+        ("entries", "gauge", "sweets_cache_entries"),
+    ):
+        if stats:
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(f'{metric}{{cache="{name}"}} {s[field]}' for name, s in stats.items())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,751 @@
+import random
+import re
+import secrets
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReadPreference, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Fields a free-text search can be scoped to.
+TEXT_FIELDS = ("category", "name")
+
+def search_fields(doc):
+    """Lowercased copies of a sweet's searchable fields, which back the prefix indexes."""
+    return {f"{field}_lower": doc[field].lower() for field in TEXT_FIELDS}
+
+@dataclass(frozen=True)
+class SweetQuery:
+    """Catalog filter; name, category and text are lowercased prefixes.
+
+    Filters are ANDed, except text, which matches if any of text_fields
+    starts with it.
+    """
+    name: str | None = None
+    category: str | None = None
+    min_price: float | None = None
+    max_price: float | None = None
+    text: str | None = None
+    text_fields: tuple = TEXT_FIELDS
+
+    @classmethod
+    def build(cls, name=None, category=None, min_price=None, max_price=None, text=None, text_fields=None):
+        def term(value):
+            value = value.strip().lower() if value else ""
+            return value or None
+        text = term(text)
+        # Sorted and defaulted so equal searches share a cache key.
+        fields = tuple(sorted(set(text_fields))) if text and text_fields else TEXT_FIELDS
+        return cls(term(name), term(category), min_price, max_price, text, fields)
+
+# Listings return sweets in the API's shape: a string "id" and the public fields.
+LISTED_FIELDS = ("name", "category", "price", "quantity")
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def insert(self, doc): ...
+
+    @abstractmethod
+    async def get(self, user_id): ...
+
+    @abstractmethod
+    async def get_by_email(self, email): ...
+
+    @abstractmethod
+    async def delete(self, user_id): ...
+
+    @abstractmethod
+    async def token_version(self, user_id): ...
+
+    @abstractmethod
+    async def token_versions(self): ...
+
+    @abstractmethod
+    async def bump_token_version(self, user_id, expires_at): ...
+
+class SweetRepository(ABC):
+    """Sweets storage. Documents carry an ObjectId ``_id``; listings are in ``_id`` order.
+
+    A sweet's stock may be split over sub-counters (see split_stock); reads
+    report the total as ``quantity`` and get/get_many also return
+    ``stock_shards``, the number of counters.
+    """
+
+    @abstractmethod
+    async def insert(self, doc): ...
+
+    @abstractmethod
+    async def insert_many(self, docs):
+        """Insert docs in one batch and return their ids."""
+
+    @abstractmethod
+    async def upsert_many(self, docs):
+        """Write docs in one unordered batch, matching on _id or else on name_lower.
+
+        Returns (inserted, updated, errors) with errors as (index, message) pairs.
+        """
+
+    @abstractmethod
+    async def get(self, sweet_id): ...
+
+    async def get_for_display(self, sweet_id):
+        """get(), for showing to users; may be served slightly stale."""
+        return await self.get(sweet_id)
+
+    @abstractmethod
+    async def get_many(self, sweet_ids): ...
+
+    @abstractmethod
+    async def find(self, query, after=None, limit=None):
+        """Sweets matching query with _id > after, as a list of LISTED_FIELDS plus "id"."""
+
+    @abstractmethod
+    def stream(self, query, after=None, limit=None):
+        """Like find, but an async iterator that does not buffer the result."""
+
+    @abstractmethod
+    async def replace(self, sweet_id, fields):
+        """Set fields and return the updated sweet, or None if it does not exist."""
+
+    @abstractmethod
+    async def delete(self, sweet_id): ...
+
+    @abstractmethod
+    async def delete_many(self, sweet_ids):
+        """Delete sweets in one batch and return how many existed."""
+
+    @abstractmethod
+    async def take(self, sweet_id, quantity):
+        """Atomically decrement quantity if enough stock is left.
+
+        Returns the sweet as it was before (None if missing); the decrement
+        happened only if its quantity was at least the requested one.
+        """
+
+    @abstractmethod
+    async def add(self, sweet_id, quantity):
+        """Increment quantity; returns False if the sweet does not exist."""
+
+    @abstractmethod
+    async def take_many(self, wanted):
+        """Decrement {sweet_id: quantity} all-or-nothing; returns whether it applied."""
+
+    @abstractmethod
+    async def split_stock(self, sweet_id, shards):
+        """Spread the stock over `shards` sub-counters, 1 folding them back.
+
+        Counter 0 is the sweet's own quantity and the rest are separate
+        documents, so concurrent decrements do not all contend on one.
+        Returns False if the sweet does not exist.
+        """
+
+    @abstractmethod
+    async def take_sharded(self, sweet_id, quantity, shards):
+        """Decrement a split sweet's stock from whichever counters hold it.
+
+        Returns True if taken, False if they hold too little in total and None
+        if the sweet is missing. `shards` may be stale: counters that no
+        longer exist are skipped.
+        """
+
+    @abstractmethod
+    async def add_sharded(self, sweet_id, quantity, shards):
+        """Spread an increment over the counters; returns False if the sweet is missing."""
+
+    @abstractmethod
+    async def low_stock(self, threshold, limit):
+        """Listed sweets with at most `threshold` in stock, fewest first."""
+
+    @abstractmethod
+    async def facets(self, query, price_boundaries, max_categories):
+        """Counts for the sweets matching query, in one pass:
+
+        {"total", "in_stock", "categories": [{"category", "count"}],
+         "prices": [{"min", "max", "count"}]}
+
+        Categories are grouped case-insensitively, most sweets first. Price
+        buckets run from one boundary up to the next; the last has no max.
+        Empty buckets are left out.
+        """
+
+class LedgerRepository(ABC):
+    """Append-only inventory movements: sweet_id, kind, signed change, user_id, at."""
+
+    @abstractmethod
+    async def insert_many(self, entries): ...
+
+class StatsRepository(ABC):
+    """Rollups behind the admin analytics.
+
+    Per category: sweets, stock, stock_value, units_sold and revenue. Per
+    sweet: name, category, units_sold and revenue. Kept up to date by
+    increments and rebuilt from the catalog and the ledger by reconcile_*.
+    """
+
+    @abstractmethod
+    async def add(self, categories, sweets):
+        """Apply {category: {field: increment}} and {sweet_id: (name, category, units_sold, revenue)}."""
+
+    @abstractmethod
+    async def categories(self): ...
+
+    @abstractmethod
+    async def top_sellers(self, by, limit): ...
+
+    @abstractmethod
+    async def reconcile_stock(self):
+        """Recompute the per-category stock totals from the catalog."""
+
+    @abstractmethod
+    async def reconcile_sales(self):
+        """Recompute the sales counters from the ledger."""
+
+class ReservationRepository(ABC):
+    """Time-limited stock holds; whoever pops or claims a reservation owns its stock."""
+
+    @abstractmethod
+    async def insert(self, doc): ...
+
+    @abstractmethod
+    async def pop(self, reservation_id, user_id, active_at=None):
+        """Delete and return the user's unclaimed reservation, if it expires after active_at when given."""
+
+    @abstractmethod
+    async def claim_expired(self, now, until):
+        """Return one reservation that expired by now and is unclaimed (or its
+        claim lapsed), marking it claimed until `until`; None if there is none."""
+
+    @abstractmethod
+    async def delete(self, reservation_id): ...
+
+class MongoLedgerRepository(LedgerRepository):
+    def __init__(self, db):
+        self.db = db
+
+    async def insert_many(self, entries):
+        await self.db.ledger.insert_many(entries, ordered=False)
+
+CATEGORY_STATS = ("sweets", "stock", "stock_value", "units_sold", "revenue")
+
+class MongoStatsRepository(StatsRepository):
+    def __init__(self, db):
+        self.db = db
+
+    async def ensure_indexes(self):
+        await self.db.sweet_stats.create_indexes([
+            IndexModel([("units_sold", DESCENDING)]),
+            IndexModel([("revenue", DESCENDING)]),
+        ])
+
+    async def add(self, categories, sweets):
+        if categories:
+            await self.db.category_stats.bulk_write([
+                UpdateOne({"_id": category}, {"$inc": increments}, upsert=True)
+                for category, increments in categories.items()
+            ], ordered=False)
+        if sweets:
+            await self.db.sweet_stats.bulk_write([
+                UpdateOne(
+                    {"_id": sweet_id},
+                    {"$set": {"name": name, "category": category}, "$inc": {"units_sold": units_sold, "revenue": revenue}},
+                    upsert=True,
+                )
+                for sweet_id, (name, category, units_sold, revenue) in sweets.items()
+            ], ordered=False)
+
+    async def categories(self):
+        projection = {"_id": 0, "category": "$_id", **{field: {"$ifNull": [f"${field}", 0]} for field in CATEGORY_STATS}}
+        return await self.db.category_stats.find({}, projection).sort("_id", ASCENDING).to_list(None)
+
+    async def top_sellers(self, by, limit):
+        projection = {"_id": 0, "id": {"$toString": "$_id"}, "name": 1, "category": 1, "units_sold": 1, "revenue": 1}
+        return await self.db.sweet_stats.find({}, projection).sort(by, DESCENDING).limit(limit).to_list(None)
+
+    async def reconcile_stock(self):
+        run = secrets.token_hex(8)
+        await self.db.sweets.aggregate([
+            {"$lookup": {"from": "stock_shards", "localField": "_id", "foreignField": "sweet_id", "as": "shards"}},
+            {"$set": {"quantity": {"$add": ["$quantity", {"$sum": "$shards.quantity"}]}}},
+            {"$group": {
+                "_id": "$category",
+                "sweets": {"$sum": 1},
+                "stock": {"$sum": "$quantity"},
+                "stock_value": {"$sum": {"$multiply": ["$quantity", "$price"]}},
+            }},
+            {"$set": {"reconciled": run}},
+            {"$merge": {"into": "category_stats", "whenMatched": "merge", "whenNotMatched": "insert"}},
+        ]).to_list(None)
+        # Categories without sweets left did not come out of the $group.
+        await self.db.category_stats.update_many(
+            {"reconciled": {"$ne": run}}, {"$set": {"sweets": 0, "stock": 0, "stock_value": 0, "reconciled": run}}
+        )
+
+    async def reconcile_sales(self):
+        sold = {"$match": {"sold": {"$gt": 0}}}
+        totals = {"units_sold": {"$sum": "$sold"}, "revenue": {"$sum": {"$multiply": ["$sold", "$price"]}}}
+        await self.db.ledger.aggregate([
+            sold,
+            {"$group": {"_id": "$sweet_id", "name": {"$last": "$name"}, "category": {"$last": "$category"}, **totals}},
+            {"$merge": {"into": "sweet_stats", "whenMatched": "merge", "whenNotMatched": "insert"}},
+        ]).to_list(None)
+        await self.db.ledger.aggregate([
+            sold,
+            {"$group": {"_id": "$category", **totals}},
+            {"$merge": {"into": "category_stats", "whenMatched": "merge", "whenNotMatched": "insert"}},
+        ]).to_list(None)
+
+class MongoReservationRepository(ReservationRepository):
+    def __init__(self, db):
+        self.db = db
+
+    async def insert(self, doc):
+        res = await self.db.reservations.insert_one(doc)
+        doc["_id"] = res.inserted_id
+        return doc
+
+    async def pop(self, reservation_id, user_id, active_at=None):
+        spec = {"_id": ObjectId(reservation_id), "user_id": user_id, "claimed_until": {"$exists": False}}
+        if active_at is not None:
+            spec["expires_at"] = {"$gt": active_at}
+        return await self.db.reservations.find_one_and_delete(spec)
+
+    async def claim_expired(self, now, until):
+        return await self.db.reservations.find_one_and_update(
+            {"expires_at": {"$lte": now}, "claimed_until": {"$not": {"$gt": now}}},
+            {"$set": {"claimed_until": until}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def delete(self, reservation_id):
+        await self.db.reservations.delete_one({"_id": ObjectId(reservation_id)})
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, db):
+        self.db = db
+
+    async def insert(self, doc):
+        res = await self.db.users.insert_one(doc)
+        doc["_id"] = res.inserted_id
+        return doc
+
+    async def get(self, user_id):
+        return await self.db.users.find_one({"_id": ObjectId(user_id)})
+
+    async def get_by_email(self, email):
+        return await self.db.users.find_one({"email": email})
+
+    async def delete(self, user_id):
+        result = await self.db.users.delete_one({"_id": ObjectId(user_id)})
+        return result.deleted_count > 0
+
+    async def token_version(self, user_id):
+        doc = await self.db.revocations.find_one({"_id": user_id})
+        return doc["version"] if doc else 0
+
+    async def token_versions(self):
+        # Once expires_at has passed, every token the last bump revoked has
+        # expired, so only the other records need checking.
+        active = self.db.revocations.find({"expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return {doc["_id"]: doc["version"] async for doc in active}
+
+    async def bump_token_version(self, user_id, expires_at):
+        # The record is kept after expires_at: tokens issued since carry its
+        # version, and a later bump has to go past that, not start over at 1.
+        doc = await self.db.revocations.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"version": 1}, "$set": {"expires_at": expires_at}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["version"]
+
+def _prefix(term):
+    return {"$regex": "^" + re.escape(term)}
+
+def mongo_filter(query, after=None):
+    # Anchored, escaped, case-sensitive regexes on the lowercased fields are
+    # turned into index bounds by the planner instead of a collection scan.
+    spec = {}
+    if query.name:
+        spec["name_lower"] = _prefix(query.name)
+    if query.category:
+        spec["category_lower"] = _prefix(query.category)
+    if query.text:
+        spec["$or"] = [{f"{field}_lower": _prefix(query.text)} for field in query.text_fields]
+    if query.min_price is not None or query.max_price is not None:
+        spec["price"] = {}
+        if query.min_price is not None:
+            spec["price"]["$gte"] = query.min_price
+        if query.max_price is not None:
+            spec["price"]["$lte"] = query.max_price
+    if after is not None:
+        spec["_id"] = {"$gt": after}
+    return spec
+
+# The server converts _id and drops the search fields, so the driver decodes
+# only what the response needs.
+_LISTED_PROJECTION = {"_id": 0, "id": {"$toString": "$_id"}, "stock_shards": 1, **{field: 1 for field in LISTED_FIELDS}}
+
+class MongoSweetRepository(SweetRepository):
+    def __init__(self, client, db, supports_transactions=False, catalog_db=None, last_operation_time=None):
+        self.client = client
+        self.db = db
+        self.supports_transactions = supports_transactions
+        # Listings and get_for_display read through this, e.g. from secondaries.
+        self.catalog_db = db if catalog_db is None else catalog_db
+        # Returns the cluster time of the newest write this worker has seen.
+        self.last_operation_time = last_operation_time
+
+    @asynccontextmanager
+    async def _catalog_session(self):
+        # A secondary behind the write that invalidated a cached page could
+        # otherwise cache the old values again, for as long as it lags. In a
+        # causally consistent session the read waits until it has caught up.
+        if self.catalog_db.read_preference == ReadPreference.PRIMARY or self.last_operation_time is None:
+            yield None
+            return
+        async with await self.client.start_session(causal_consistency=True) as session:
+            operation_time = self.last_operation_time()
+            if operation_time is not None:
+                session.advance_operation_time(operation_time)
+            yield session
+
+    async def ensure_indexes(self):
+        # Backfill the lowercased search fields for sweets written before they
+        # existed. Done here rather than with $toLower, which only lowercases
+        # ASCII, so "Éclair" is found the same way as when it is written now.
+        backfill = []
+        async for doc in self.db.sweets.find({"name_lower": {"$exists": False}}, dict.fromkeys(TEXT_FIELDS, 1)):
+            backfill.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_fields(doc)}))
+            if len(backfill) == 1000:
+                await self.db.sweets.bulk_write(backfill, ordered=False)
+                backfill = []
+        if backfill:
+            await self.db.sweets.bulk_write(backfill, ordered=False)
+        await self.db.sweets.create_indexes([
+            IndexModel([("name_lower", ASCENDING)]),
+            IndexModel([("category_lower", ASCENDING), ("price", ASCENDING)]),
+            IndexModel([("price", ASCENDING)]),
+            IndexModel([("quantity", ASCENDING)]),
+        ])
+        await self.db.users.create_index("email")
+        # Revocation records used to be dropped by a TTL index on expires_at.
+        indexes = await self.db.revocations.index_information()
+        if "expireAfterSeconds" in indexes.get("expires_at_1", {}):
+            await self.db.revocations.drop_index("expires_at_1")
+        await self.db.revocations.create_index("expires_at")
+        # No TTL here: the sweeper has to put the held stock back before deleting.
+        await self.db.reservations.create_index("expires_at")
+        await self.db.stock_shards.create_index("sweet_id")
+        await self.db.ledger.create_index([("sweet_id", ASCENDING), ("at", ASCENDING)])
+
+    async def insert(self, doc):
+        res = await self.db.sweets.insert_one(doc)
+        doc["_id"] = res.inserted_id
+        return doc
+
+    async def insert_many(self, docs):
+        res = await self.db.sweets.insert_many(docs, ordered=False)
+        return res.inserted_ids
+
+    async def upsert_many(self, docs):
+        # Written quantities replace split stock, like replace does. Rows without
+        # an id match on name_lower, so their split sweets are looked up first.
+        replaced = [doc["_id"] for doc in docs if "_id" in doc]
+        names = [doc["name_lower"] for doc in docs if "_id" not in doc]
+        if names:
+            split = self.db.sweets.find({"name_lower": {"$in": names}, "stock_shards": {"$gt": 1}}, {"_id": 1})
+            replaced += [doc["_id"] async for doc in split]
+        await self.db.stock_shards.delete_many({"sweet_id": {"$in": replaced}})
+        ops = [
+            UpdateOne(
+                {"_id": doc["_id"]} if "_id" in doc else {"name_lower": doc["name_lower"]},
+                {"$set": {k: v for k, v in doc.items() if k != "_id"}, "$unset": {"stock_shards": ""}},
+                upsert=True,
+            )
+            for doc in docs
+        ]
+        try:
+            result = await self.db.sweets.bulk_write(ops, ordered=False)
+            return result.upserted_count, result.matched_count, []
+        except BulkWriteError as exc:
+            errors = [(error["index"], error["errmsg"]) for error in exc.details["writeErrors"]]
+            return exc.details["nUpserted"], exc.details["nMatched"], errors
+
+    async def _with_shard_totals(self, sweets, key="_id", keep_layout=False, db=None, session=None):
+        # A split sweet's quantity is its own counter plus its sub-counters.
+        db = self.db if db is None else db
+        split = {}
+        for sweet in sweets:
+            shards = sweet.get("stock_shards", 0) if keep_layout else sweet.pop("stock_shards", 0)
+            if shards > 1:
+                split[ObjectId(sweet[key])] = sweet
+        if split:
+            async for total in db.stock_shards.aggregate([
+                {"$match": {"sweet_id": {"$in": list(split)}}},
+                {"$group": {"_id": "$sweet_id", "quantity": {"$sum": "$quantity"}}},
+            ], session=session):
+                split[total["_id"]]["quantity"] += total["quantity"]
+        return sweets
+
+    async def _get(self, db, sweet_id, session=None):
+        sweet = await db.sweets.find_one({"_id": ObjectId(sweet_id)}, session=session)
+        if sweet is not None:
+            await self._with_shard_totals([sweet], keep_layout=True, db=db, session=session)
+        return sweet
+
+    async def get(self, sweet_id):
+        return await self._get(self.db, sweet_id)
+
+    async def get_for_display(self, sweet_id):
+        async with self._catalog_session() as session:
+            return await self._get(self.catalog_db, sweet_id, session)
+
+    async def get_many(self, sweet_ids):
+        sweets = await self.db.sweets.find({"_id": {"$in": [ObjectId(i) for i in sweet_ids]}}).to_list(None)
+        return await self._with_shard_totals(sweets, keep_layout=True)
+
+    def _cursor(self, query, after, limit, session):
+        found = self.catalog_db.sweets.find(mongo_filter(query, after), _LISTED_PROJECTION, session=session)
+        found = found.sort("_id", ASCENDING)
+        return found.limit(limit) if limit else found
+
+    async def find(self, query, after=None, limit=None):
+        async with self._catalog_session() as session:
+            sweets = await self._cursor(query, after, limit, session).to_list(None)
+            return await self._with_shard_totals(sweets, "id", db=self.catalog_db, session=session)
+
+    async def stream(self, query, after=None, limit=None):
+        async with self._catalog_session() as session:
+            async for sweet in self._cursor(query, after, limit, session):
+                yield (await self._with_shard_totals([sweet], "id", db=self.catalog_db, session=session))[0]
+
+    async def low_stock(self, threshold, limit):
+        # A split sweet's own counter is at most its total, so filtering on it
+        # finds every candidate; the totals then rule some out.
+        found = self.db.sweets.find({"quantity": {"$lte": threshold}}, _LISTED_PROJECTION)
+        sweets = await found.sort([("quantity", ASCENDING), ("_id", ASCENDING)]).limit(limit).to_list(None)
+        return [sweet for sweet in await self._with_shard_totals(sweets, "id") if sweet["quantity"] <= threshold]
+
+    async def facets(self, query, price_boundaries, max_categories):
+        pipeline = [
+            {"$match": mongo_filter(query)},
+            {"$facet": {
+                "total": [{"$count": "count"}],
+                "categories": [
+                    {"$group": {"_id": "$category_lower", "category": {"$first": "$category"}, "count": {"$sum": 1}}},
+                    {"$sort": {"count": DESCENDING, "_id": ASCENDING}},
+                    {"$limit": max_categories},
+                ],
+                # The first bucket takes prices below the lowest boundary, and
+                # the default one those from the highest boundary up.
+                "prices": [{"$bucket": {
+                    "groupBy": "$price", "boundaries": [float("-inf"), *price_boundaries], "default": "more",
+                    "output": {"count": {"$sum": 1}},
+                }}],
+                "in_stock": [{"$match": {"quantity": {"$gt": 0}, "stock_shards": {"$not": {"$gt": 1}}}}, {"$count": "count"}],
+                # A split sweet's own counter may be empty while its
+                # sub-counters are not; those few are totalled separately.
+                "split": [{"$match": {"stock_shards": {"$gt": 1}}}, {"$project": {"quantity": 1, "stock_shards": 1}}],
+            }},
+        ]
+        async with self._catalog_session() as session:
+            result = (await self.catalog_db.sweets.aggregate(pipeline, session=session).to_list(1))[0]
+            split = await self._with_shard_totals(result["split"], db=self.catalog_db, session=session)
+        in_stock = result["in_stock"][0]["count"] if result["in_stock"] else 0
+        in_stock += sum(1 for sweet in split if sweet["quantity"] > 0)
+        prices = []
+        for bucket in result["prices"]:
+            if bucket["_id"] == "more":
+                prices.append({"min": price_boundaries[-1], "max": None, "count": bucket["count"]})
+            elif bucket["_id"] == float("-inf"):
+                prices.append({"min": None, "max": price_boundaries[0], "count": bucket["count"]})
+            else:
+                upper = price_boundaries[price_boundaries.index(bucket["_id"]) + 1]
+                prices.append({"min": bucket["_id"], "max": upper, "count": bucket["count"]})
+        return {
+            "total": result["total"][0]["count"] if result["total"] else 0,
+            "in_stock": in_stock,
+            "categories": [{"category": c["category"], "count": c["count"]} for c in result["categories"]],
+            "prices": prices,
+        }
+
+    async def replace(self, sweet_id, fields):
+        # Setting the quantity replaces split stock.
+        await self.db.stock_shards.delete_many({"sweet_id": ObjectId(sweet_id)})
+        return await self.db.sweets.find_one_and_update(
+            {"_id": ObjectId(sweet_id)},
+            {"$set": fields, "$unset": {"stock_shards": ""}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def delete(self, sweet_id):
+        result = await self.db.sweets.delete_one({"_id": ObjectId(sweet_id)})
+        await self.db.stock_shards.delete_many({"sweet_id": ObjectId(sweet_id)})
+        return result.deleted_count > 0
+
+    async def delete_many(self, sweet_ids):
+        ids = [ObjectId(i) for i in sweet_ids]
+        result = await self.db.sweets.delete_many({"_id": {"$in": ids}})
+        await self.db.stock_shards.delete_many({"sweet_id": {"$in": ids}})
+        return result.deleted_count
+
+    async def take(self, sweet_id, quantity):
+        # A pipeline update decrements only when enough stock is left; the
+        # pre-image tells "not found" apart from "insufficient stock" without a
+        # second round trip.
+        return await self.db.sweets.find_one_and_update(
+            {"_id": ObjectId(sweet_id)},
+            [{"$set": {"quantity": {"$cond": [
+                {"$gte": ["$quantity", quantity]},
+                {"$subtract": ["$quantity", quantity]},
+                "$quantity",
+            ]}}}],
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def add(self, sweet_id, quantity):
+        result = await self.db.sweets.update_one({"_id": ObjectId(sweet_id)}, {"$inc": {"quantity": quantity}})
+        return result.matched_count > 0
+
+    async def take_many(self, wanted):
+        if self.supports_transactions:
+            return await self._take_in_transaction(wanted)
+        return await self._take_with_compensation(wanted)
+
+    async def _take_in_transaction(self, wanted):
+        decrements = [
+            UpdateOne({"_id": ObjectId(i), "quantity": {"$gte": q}}, {"$inc": {"quantity": -q}})
+            for i, q in wanted.items()
+        ]
+
+        async def take(session):
+            result = await self.db.sweets.bulk_write(decrements, session=session)
+            if result.matched_count != len(wanted):
+                await session.abort_transaction()
+                return False
+            return True
+
+        # with_transaction retries on TransientTransactionError, e.g. a write
+        # conflict with a concurrent purchase of the same sweet.
+        async with await self.client.start_session() as session:
+            return await session.with_transaction(take, write_concern=self.db.write_concern)
+
+    async def _take_with_compensation(self, wanted):
+        # Without transactions, a line short of stock fails the ordered batch at
+        # that line: its update sets _id to null, which the server rejects. A
+        # sweet deleted meanwhile matches nothing. Lines before the failure are
+        # put back; for a deleted sweet that matches nothing either.
+        decrements = []
+        for i, q in wanted.items():
+            enough = {"$gte": ["$quantity", q]}
+            decrements.append(UpdateOne({"_id": ObjectId(i)}, [{"$set": {
+                "quantity": {"$cond": [enough, {"$subtract": ["$quantity", q]}, "$quantity"]},
+                "_id": {"$cond": [enough, "$_id", None]},
+            }}]))
+        try:
+            result = await self.db.sweets.bulk_write(decrements, ordered=True)
+            applied, matched = len(wanted), result.matched_count
+        except BulkWriteError as exc:
+            applied, matched = exc.details["writeErrors"][0]["index"], exc.details["nMatched"]
+        if matched == len(wanted):
+            return True
+        if applied:
+            await self.db.sweets.bulk_write([
+                UpdateOne({"_id": ObjectId(i)}, {"$inc": {"quantity": q}}) for i, q in list(wanted.items())[:applied]
+            ])
+        return False
+
+    def _counter(self, sweet_id, counter):
+        if counter == 0:
+            return self.db.sweets, ObjectId(sweet_id)
+        return self.db.stock_shards, f"{sweet_id}:{counter}"
+
+    async def _take_counter(self, sweet_id, counter, quantity):
+        if counter == 0:
+            before = await self.take(sweet_id, quantity)
+            return None if before is None else before["quantity"] >= quantity
+        taken = await self.db.stock_shards.find_one_and_update(
+            {"_id": f"{sweet_id}:{counter}", "quantity": {"$gte": quantity}}, {"$inc": {"quantity": -quantity}}
+        )
+        return taken is not None
+
+    async def _drain_counter(self, sweet_id, counter, quantity):
+        # Takes up to quantity and returns how much that was.
+        collection, key = self._counter(sweet_id, counter)
+        before = await collection.find_one_and_update(
+            {"_id": key},
+            [{"$set": {"quantity": {"$subtract": ["$quantity", {"$min": ["$quantity", quantity]}]}}}],
+            return_document=ReturnDocument.BEFORE,
+        )
+        return min(before["quantity"], quantity) if before else 0
+
+    async def take_sharded(self, sweet_id, quantity, shards):
+        counters = list(range(shards))
+        random.shuffle(counters)
+        # Usually one counter holds enough on its own.
+        for counter in counters:
+            taken = await self._take_counter(sweet_id, counter, quantity)
+            if taken is None:
+                return None
+            if taken:
+                return True
+        # Otherwise gather it from several, and put it back if they fall short.
+        taken = {}
+        for counter in counters:
+            taken[counter] = await self._drain_counter(sweet_id, counter, quantity - sum(taken.values()))
+            if sum(taken.values()) == quantity:
+                return True
+        await self.add_sharded(sweet_id, sum(taken.values()), shards)
+        return False
+
+    async def add_sharded(self, sweet_id, quantity, shards):
+        share, rest = divmod(quantity, shards)
+        if share:
+            result = await self.db.stock_shards.bulk_write([
+                UpdateOne({"_id": f"{sweet_id}:{counter}"}, {"$inc": {"quantity": share}}) for counter in range(1, shards)
+            ])
+            # Counter 0's share, plus those of sub-counters folded back meanwhile.
+            rest += share * (shards - result.matched_count)
+        return await self.add(sweet_id, rest)
+
+    async def _merge_stock(self, sweet_id):
+        result = await self.db.sweets.update_one({"_id": ObjectId(sweet_id)}, {"$unset": {"stock_shards": ""}})
+        if not result.matched_count:
+            return False
+        for shard in await self.db.stock_shards.find({"sweet_id": ObjectId(sweet_id)}, {"_id": 1}).to_list(None):
+            folded = await self.db.stock_shards.find_one_and_delete({"_id": shard["_id"]})
+            if folded and folded["quantity"]:
+                await self.add(sweet_id, folded["quantity"])
+        return True
+
+    async def split_stock(self, sweet_id, shards):
+        if not await self._merge_stock(sweet_id):
+            return False
+        if shards <= 1:
+            return True
+        sweet = await self.db.sweets.find_one_and_update(
+            {"_id": ObjectId(sweet_id)}, {"$set": {"stock_shards": shards}}, return_document=ReturnDocument.AFTER
+        )
+        if sweet is None:
+            return False
+        share = sweet["quantity"] // shards
+        moved = await self.db.sweets.update_one(
+            {"_id": ObjectId(sweet_id), "quantity": {"$gte": share * (shards - 1)}},
+            {"$inc": {"quantity": -share * (shards - 1)}},
+        )
+        if not moved.modified_count:
+            # Sold meanwhile; the sub-counters start empty and fill up on restocks.
+            share = 0
+        await self.db.stock_shards.bulk_write([
+            UpdateOne(
+                {"_id": f"{sweet_id}:{counter}"},
+                {"$inc": {"quantity": share}, "$setOnInsert": {"sweet_id": ObjectId(sweet_id)}},
+                upsert=True,
+            )
+            for counter in range(1, shards)
+        ])
+        return True
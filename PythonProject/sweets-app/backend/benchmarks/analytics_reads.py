@@ -0,0 +1,89 @@
+"""
+Analytics read benchmark.
+Per-category stock and value totals for a seeded catalog, computed two ways:
+
+  scan    stream every sweet and total them up, as a report built on
+          GET /api/sweets would
+  rollup  read the category_stats rollup (GET /api/admin/stats/categories)
+
+Also times one full reconcile, the periodic job that rebuilds the rollups,
+and checks that both ways agree.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/analytics_reads.py --sweets 100000 --rounds 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crud, database
+from app.config import settings
+from benchmarks import seed
+
+
+async def scan():
+    totals = {}
+    async for sweet in crud.stream_sweets():
+        category = totals.setdefault(sweet["category"], {"sweets": 0, "stock": 0, "stock_value": 0})
+        category["sweets"] += 1
+        category["stock"] += sweet["quantity"]
+        category["stock_value"] += sweet["quantity"] * sweet["price"]
+    return totals
+
+
+async def rollup():
+    return {row["category"]: row for row in await crud.get_category_stats()}
+
+
+def agree(scanned, rolled):
+    for category, totals in scanned.items():
+        row = rolled.get(category)
+        if row is None or row["sweets"] != totals["sweets"] or row["stock"] != totals["stock"]:
+            return False
+        # Summed in a different order, so only equal up to rounding.
+        if abs(row["stock_value"] - totals["stock_value"]) > 1e-9 * max(1, totals["stock_value"]):
+            return False
+    return True
+
+
+async def timed(label, func, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = await func()
+    per_call = (time.perf_counter() - started) / rounds
+    print(f"📊 {label:<7} {per_call * 1000:9.2f} ms per report")
+    return result, per_call
+
+
+async def main(args):
+    await database.open_storage()
+    try:
+        await seed.seed_catalog(args.sweets)
+        started = time.perf_counter()
+        await database.stats.reconcile_stock()
+        print(f"📊 reconcile {(time.perf_counter() - started) * 1000:.0f} ms for {args.sweets} sweets")
+        scanned, scan_time = await timed("scan", scan, max(1, args.rounds // 10))
+        rolled, rollup_time = await timed("rollup", rollup, args.rounds)
+        print(f"⚡ {scan_time / rollup_time:.0f}x faster")
+        ok = agree(scanned, rolled)
+        print("✅ rollups match the catalog" if ok else "❌ rollups disagree with the catalog")
+    finally:
+        if settings.STORAGE_BACKEND != "memory":
+            ids = [seed.sweet_id(n) for n in range(args.sweets)]
+            for start in range(0, len(ids), seed.BATCH):
+                await database.sweets.delete_many(ids[start:start + seed.BATCH])
+            await database.stats.reconcile_stock()
+        await database.close_storage()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sweets", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=20)
+    ok = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,60 @@
+"""
+Auth fast path benchmark.
+Measures requests/sec on GET /api/sweets with the decoded-token and
+principal caches disabled and enabled, in-process over ASGI.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/auth_fast_path.py --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import auth, crud, database
+from app.main import app
+
+
+async def run(client, headers, count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            resp = await client.get("/api/sweets", headers=headers)
+            resp.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    return count / (time.perf_counter() - started)
+
+
+async def main(args):
+    await database.open_storage()
+    user = None
+    try:
+        user = await crud.create_user(f"fastpath-{os.getpid()}@example.com", "-", False)
+        headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': str(user['_id'])})}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for enabled in (False, True):
+                auth._payloads.enabled = auth._principals.enabled = enabled
+                auth._payloads.clear()
+                auth._principals.clear()
+                rate = await run(client, headers, args.requests, args.concurrency)
+                print(f"📊 auth caches {'on ' if enabled else 'off'}: {rate:.0f} req/s")
+    finally:
+        if user:
+            await database.users.delete(user["_id"])
+        await database.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
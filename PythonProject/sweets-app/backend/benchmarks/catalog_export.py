@@ -0,0 +1,95 @@
+"""
+Catalog export benchmark.
+Seeds a large catalog and streams it through GET /api/sweets?format=ndjson,
+reporting time to first byte, total time and peak Python heap usage.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/catalog_export.py --sweets 100000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crud, database
+from app.auth import create_access_token
+from app.main import app
+
+
+async def main(args):
+    await database.open_storage()
+    tag = f"export-{os.getpid()}"
+    user = None
+    sweet_ids = []
+    try:
+        for start in range(0, args.sweets, 10_000):
+            batch = range(start, min(start + 10_000, args.sweets))
+            sweet_ids += await database.sweets.insert_many(
+                [
+                    {"name": f"{tag}-{n}", "category": tag, "name_lower": f"{tag}-{n}", "category_lower": tag,
+                     "price": n % 500, "quantity": 10}
+                    for n in batch
+                ]
+            )
+        user = await crud.create_user(f"{tag}@example.com", "-", False)
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user['_id'])})}"}
+
+        # Drive the ASGI app directly: httpx's ASGI transport buffers the whole
+        # body, which would hide the time to first byte.
+        query = urlencode({"format": "ndjson", "category": tag}).encode()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/api/sweets/search", "raw_path": b"/api/sweets/search",
+            "query_string": query, "root_path": "", "server": ("bench", 80), "client": ("bench", 1),
+            "headers": [(b"authorization", headers["Authorization"].encode())],
+        }
+        first_byte = None
+        rows = 0
+        requested = False
+        finished = asyncio.Event()
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal first_byte, rows
+            if message["type"] == "http.response.body":
+                if message.get("body"):
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - started
+                    rows += message["body"].count(b"\n")
+                if not message.get("more_body"):
+                    finished.set()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        await app(scope, receive, send)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"📊 streamed {rows} sweets")
+        print(f"   time to first byte: {first_byte * 1000:.1f} ms")
+        print(f"   total:              {elapsed:.2f} s ({rows / elapsed:.0f} rows/s)")
+        print(f"   peak heap:          {peak / 1024 / 1024:.1f} MiB")
+    finally:
+        await database.sweets.delete_many(sweet_ids)
+        if user:
+            await database.users.delete(user["_id"])
+        await database.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sweets", type=int, default=100_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+Checkout throughput benchmark.
+Compares placing multi-line orders through POST /api/orders against one
+POST /api/sweets/{id}/purchase call per line item, in-process over ASGI.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/checkout_throughput.py --orders 500 --lines 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import crud, database, ledger
+from app.auth import create_access_token
+from app.main import app
+from app.schemas import SweetCreate
+
+
+async def per_item(client, headers, order):
+    for sweet_id, quantity in order:
+        resp = await client.post(f"/api/sweets/{sweet_id}/purchase", params={"quantity": quantity}, headers=headers)
+        resp.raise_for_status()
+
+
+async def batched(client, headers, order):
+    items = [{"sweet_id": sweet_id, "quantity": quantity} for sweet_id, quantity in order]
+    resp = await client.post("/api/orders", json={"items": items}, headers=headers)
+    resp.raise_for_status()
+
+
+async def run(label, place, client, headers, orders, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(order):
+        async with semaphore:
+            await place(client, headers, order)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(order) for order in orders))
+    elapsed = time.perf_counter() - started
+    lines = sum(len(order) for order in orders)
+    print(f"📊 {label}: {len(orders) / elapsed:.0f} orders/s, {lines / elapsed:.0f} lines/s")
+
+
+async def main(args):
+    await database.open_storage()
+    # Stock changes are recorded by the background writer, as in the app.
+    ledger.inventory.start()
+    sweet_ids = []
+    user = None
+    try:
+        for n in range(args.catalog):
+            sweet = await crud.create_sweet(SweetCreate(name=f"bench-{n}", category="bench", price=1.0, quantity=10**9))
+            sweet_ids.append(sweet["id"])
+        user = await crud.create_user(f"bench-{os.getpid()}@example.com", "-", False)
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user['_id'])})}"}
+        rng = random.Random(42)
+        orders = [
+            [(sweet_id, 1) for sweet_id in rng.sample(sweet_ids, args.lines)]
+            for _ in range(args.orders)
+        ]
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await run("per-item purchase", per_item, client, headers, orders, args.concurrency)
+            await run("POST /api/orders", batched, client, headers, orders, args.concurrency)
+    finally:
+        for sweet_id in sweet_ids:
+            await crud.delete_sweet(sweet_id)
+        if user:
+            await database.users.delete(user["_id"])
+        await ledger.inventory.stop()
+        await database.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--catalog", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
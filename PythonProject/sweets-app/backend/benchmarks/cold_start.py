@@ -0,0 +1,120 @@
+"""
+Worker cold-start benchmark.
+Measures what a new worker pays before it can serve:
+
+  import   importing app.main in a fresh interpreter, and how much of it was
+           deferred to first use (passlib/argon2, python-jose)
+  ready    starting serve.py until GET /health/ready answers
+  drain    SIGTERM with an event stream open until the server has exited;
+           should be well under WEB_GRACEFUL_SECONDS, as streams are closed
+           rather than waited out
+
+With STORAGE_BACKEND=memory each worker has its own users, so the drain
+check registers, logs in and subscribes over one connection (one worker).
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/cold_start.py --imports 10 --workers 2
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app.config import settings
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+import jose.jwt, passlib.context, passlib.handlers.argon2
+print(imported - started, time.perf_counter() - imported)
+"""
+
+
+def time_imports(count):
+    app_times, deferred_times = [], []
+    for _ in range(count):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.split()
+        app_times.append(float(out[0]))
+        deferred_times.append(float(out[1]))
+    print(f"📊 import app.main:      {statistics.median(app_times) * 1000:7.1f} ms (median of {count})")
+    print(f"   deferred to first use: {statistics.median(deferred_times) * 1000:7.1f} ms")
+
+
+def wait_until_ready(client, server, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server.poll() is None:
+        try:
+            if client.get("/health/ready").status_code == 200:
+                return True
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return False
+
+
+def drain(client, server):
+    email = f"cold-start-{os.getpid()}@example.com"
+    client.post("/api/auth/register", json={"email": email, "password": "cold-start"}).raise_for_status()
+    started = time.perf_counter()
+    resp = client.post("/api/auth/login", json={"email": email, "password": "cold-start"})
+    resp.raise_for_status()
+    print(f"📊 first login:           {(time.perf_counter() - started) * 1000:7.1f} ms")
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    resynced = False
+    with client.stream("GET", "/api/sweets/events", headers=headers) as events:
+        lines = events.iter_lines()
+        next(lines)
+        started = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        for line in lines:
+            resynced = resynced or line == "event: resync"
+    server.wait(settings.WEB_GRACEFUL_SECONDS + 10)
+    elapsed = time.perf_counter() - started
+    print(f"📊 drain:                 {elapsed * 1000:7.1f} ms (graceful timeout {settings.WEB_GRACEFUL_SECONDS} s)")
+    return resynced and elapsed < settings.WEB_GRACEFUL_SECONDS
+
+
+def main(args):
+    time_imports(args.imports)
+    env = dict(os.environ, WEB_HOST="127.0.0.1", WEB_PORT=str(args.port), WEB_WORKERS=str(args.workers))
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "serve.py"], cwd=BACKEND_DIR, env=env)
+    ok = False
+    try:
+        # One connection, so every request reaches the same worker.
+        limits = httpx.Limits(max_connections=1)
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=30) as client:
+            if not wait_until_ready(client, server, args.timeout):
+                print("   ❌ serve.py did not become ready")
+                return False
+            print(f"📊 ready ({args.workers} workers):   {(time.perf_counter() - started) * 1000:7.1f} ms")
+            ok = drain(client, server)
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.wait()
+    print("   ✅ event stream closed and server drained" if ok else "   ❌ server did not drain in time")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imports", type=int, default=10, help="fresh interpreters to time the import in")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for readiness")
+    ok = main(parser.parse_args())
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,56 @@
+"""
+Compares two result files written by benchmarks/run.py --output.
+Exits with status 1 when a scenario lost more than --threshold percent of its
+throughput or its p95 latency grew by more than that, so it can gate CI.
+
+Run from the backend directory:
+    python benchmarks/compare.py before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"📦 {before['meta']['commit']} -> {after['meta']['commit']}")
+    for key in ("backend", "transport", "workers", "sweets", "concurrency"):
+        if before["meta"].get(key) != after["meta"].get(key):
+            print(f"⚠️  {key} differs: {before['meta'].get(key)} vs {after['meta'].get(key)}")
+
+    regressions = []
+    for name, old in before["scenarios"].items():
+        new = after["scenarios"].get(name)
+        if new is None:
+            print(f"   {name}: missing from {args.after}")
+            continue
+        throughput = change(old["throughput"], new["throughput"])
+        p95 = change(old["latency_ms"]["p95"], new["latency_ms"]["p95"])
+        line = (f"{name}: {old['throughput']} -> {new['throughput']} req/s ({throughput:+.1f}%), "
+                f"p95 {old['latency_ms']['p95']} -> {new['latency_ms']['p95']} ms ({p95:+.1f}%)")
+        if old.get("round_trips_per_request") is not None and new.get("round_trips_per_request") is not None:
+            line += f", round trips {old['round_trips_per_request']} -> {new['round_trips_per_request']}"
+        if throughput < -args.threshold or p95 > args.threshold:
+            regressions.append(name)
+            print(f"❌ {line}")
+        else:
+            print(f"✅ {line}")
+
+    if regressions:
+        print(f"❌ Regressed beyond {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    main(parser.parse_args())
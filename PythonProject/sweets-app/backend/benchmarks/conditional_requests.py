@@ -0,0 +1,74 @@
+"""
+Conditional request benchmark.
+Replays repeated dashboard renders (GET /api/sweets) with and without
+If-None-Match, reporting bytes transferred and latency per render.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/conditional_requests.py --renders 500 --sweets 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import crud, database
+from app.auth import create_access_token
+from app.main import app
+from benchmarks.stats import percentile
+
+
+async def renders(client, headers, count, conditional):
+    etag = None
+    latencies = []
+    transferred = 0
+    for _ in range(count):
+        request_headers = dict(headers)
+        if conditional and etag:
+            request_headers["If-None-Match"] = etag
+        started = time.perf_counter()
+        resp = await client.get("/api/sweets", headers=request_headers)
+        latencies.append(time.perf_counter() - started)
+        transferred += len(resp.content)
+        etag = resp.headers.get("ETag", etag)
+    return latencies, transferred
+
+
+async def main(args):
+    await database.open_storage()
+    tag = f"etag-{os.getpid()}"
+    user = None
+    sweet_ids = []
+    try:
+        sweet_ids += await database.sweets.insert_many(
+            [
+                {"name": f"{tag}-{n}", "category": tag, "name_lower": f"{tag}-{n}", "category_lower": tag,
+                 "price": n % 50, "quantity": 10}
+                for n in range(args.sweets)
+            ]
+        )
+        user = await crud.create_user(f"{tag}@example.com", "-", False)
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user['_id'])})}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for label, conditional in (("unconditional", False), ("If-None-Match", True)):
+                latencies, transferred = await renders(client, headers, args.renders, conditional)
+                print(f"📊 {label}")
+                print(f"   bytes per render:  {transferred / args.renders:.0f}")
+                print(f"   p50 / p99 latency: {percentile(latencies, 50) * 1000:.2f} ms / {percentile(latencies, 99) * 1000:.2f} ms")
+    finally:
+        await database.sweets.delete_many(sweet_ids)
+        if user:
+            await database.users.delete(user["_id"])
+        await database.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=500)
+    parser.add_argument("--sweets", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,157 @@
+"""
+Scenario mixes and the closed-loop load runner used by benchmarks/run.py.
+"""
+import asyncio
+import functools
+import json
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+from pymongo import monitoring
+
+from benchmarks import seed
+from benchmarks.stats import percentile
+
+
+@dataclass
+class Scenario:
+    description: str
+    requests: int
+    # (rng, catalog size) -> (method, path, params, body, token name); the
+    # body is sent as JSON, or as is if it is bytes.
+    next_request: object
+
+
+def browse(rng, sweets):
+    if rng.random() < 0.7:
+        return "GET", "/api/sweets", {"limit": rng.choice([20, 50, 100])}, None, "shopper"
+    return "GET", f"/api/sweets/{seed.sweet_id(rng.randrange(sweets))}", None, None, "shopper"
+
+
+def search(rng, sweets):
+    params = {}
+    roll = rng.random()
+    if roll < 0.5:
+        params["name"] = rng.choice(seed.WORDS)[:rng.randint(1, 4)]
+    if roll > 0.3:
+        params["category"] = rng.choice(seed.CATEGORIES)
+    if rng.random() < 0.4:
+        low = rng.randrange(0, 200)
+        params.update(min_price=low, max_price=low + rng.randrange(5, 50))
+    params["limit"] = 50
+    return "GET", "/api/sweets/search", params, None, "shopper"
+
+
+def facets(rng, sweets):
+    params = {}
+    if rng.random() < 0.6:
+        params["q"] = rng.choice(seed.WORDS + seed.CATEGORIES)[:rng.randint(1, 4)]
+    if rng.random() < 0.3:
+        low = rng.randrange(0, 200)
+        params.update(min_price=low, max_price=low + rng.randrange(5, 50))
+    return "GET", "/api/sweets/facets", params, None, "shopper"
+
+
+def purchase(rng, sweets):
+    sweet = seed.sweet_id(rng.randrange(min(seed.HOT_SKUS, sweets)))
+    return "POST", f"/api/sweets/{sweet}/purchase", {"quantity": rng.randint(1, 3)}, None, "shopper"
+
+
+def login(rng, sweets):
+    return "POST", "/api/auth/login", None, {"email": seed.SHOPPER_EMAIL, "password": seed.PASSWORD}, None
+
+
+def restock(rng, sweets):
+    sweet = seed.sweet_id(rng.randrange(sweets))
+    return "POST", f"/api/sweets/{sweet}/restock", {"quantity": rng.randint(10, 100)}, None, "admin"
+
+
+@functools.lru_cache(maxsize=1)
+def catalog(sweets):
+    return list(seed.sweets(sweets))
+
+
+def bulk_restock(rng, sweets):
+    # An NDJSON import that tops up BULK_RESTOCK_ROWS sweets, keeping their
+    # other fields so later scenarios still see the seeded catalog.
+    lines = []
+    for doc in rng.sample(catalog(sweets), min(BULK_RESTOCK_ROWS, sweets)):
+        row = {field: doc[field] for field in ("name", "category", "price")}
+        lines.append(json.dumps({"id": str(doc["_id"]), **row, "quantity": doc["quantity"] + rng.randint(10, 100)}))
+    return "POST", "/api/sweets/import", {"format": "ndjson"}, "\n".join(lines).encode(), "admin"
+
+
+BULK_RESTOCK_ROWS = 200
+
+SCENARIOS = {
+    "browse": Scenario("Catalog listing pages and sweet details", 2000, browse),
+    "search": Scenario("Name prefix, category and price range searches", 2000, search),
+    "facets": Scenario("Category counts and price histograms for search filters", 2000, facets),
+    "purchase": Scenario(f"Purchases contending on the {seed.HOT_SKUS} hot SKUs", 2000, purchase),
+    "login": Scenario("Concurrent logins hashing passwords", 200, login),
+    "restock": Scenario("Admin restocks across the whole catalog", 2000, restock),
+    "bulk_restock": Scenario(f"Admin imports topping up {BULK_RESTOCK_ROWS} sweets each", 100, bulk_restock),
+}
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """Counts commands sent to MongoDB, one per round trip."""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def run(client, scenario, sweets, tokens, total, concurrency, seed_value=0):
+    """Closed loop: `concurrency` users each send their next request as soon as
+    the previous one completes, until `total` requests have been sent."""
+    rng = random.Random(seed_value)
+    # Pre-generate the requests so every run sends the same sequence.
+    planned = [scenario.next_request(rng, sweets) for _ in range(total)]
+    headers = {name: {"Authorization": f"Bearer {token}"} for name, token in tokens.items()}
+    latencies = []
+    statuses = Counter()
+    position = 0
+
+    async def user():
+        nonlocal position
+        while position < total:
+            method, path, params, body, token = planned[position]
+            position += 1
+            started = time.perf_counter()
+            try:
+                payload = {"content": body} if isinstance(body, bytes) else {"json": body}
+                resp = await client.request(method, path, params=params, headers=headers.get(token), **payload)
+                status = str(resp.status_code)
+            except Exception as exc:
+                status = type(exc).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput": round(total / elapsed, 1),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3),
+        },
+        "statuses": dict(sorted(statuses.items())),
+    }
@@ -0,0 +1,112 @@
+"""
+Ledger write benchmark.
+Concurrent single-unit purchases spread over a few sweets, each recorded in
+the inventory ledger one of three ways:
+
+  inline    one insert per purchase, awaited by the request
+  buffered  queued and flushed by ledger.Ledger in batched insert_many calls
+  sync      batched like buffered, but each purchase waits for its batch
+
+Checks that every accepted purchase ended up in the ledger once the writer
+was stopped, and reports throughput, latency and insert calls per purchase.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/ledger_writes.py --purchases 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+
+from app import crud, database, ledger
+from app.config import settings
+from app.schemas import SweetCreate
+from benchmarks.stats import percentile
+
+
+class CountingLedger:
+    """Wraps the ledger repository to count insert_many calls and entries."""
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.calls = 0
+        self.entries = []
+
+    async def insert_many(self, entries):
+        self.calls += 1
+        self.entries.extend(entries)
+        await self.repository.insert_many(entries)
+
+
+async def run(label, writer, sweet_ids, args):
+    counting = CountingLedger(database.ledger)
+    database.ledger = counting
+    ledger.inventory = writer
+    user_id = f"bench-{os.getpid()}-{label}"
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(n):
+        async with semaphore:
+            started = time.perf_counter()
+            await crud.purchase_sweet(sweet_ids[n % len(sweet_ids)], 1, user_id)
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        if label != "inline":
+            writer.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(args.purchases)))
+        elapsed = time.perf_counter() - started
+        await writer.stop()
+    finally:
+        database.ledger = counting.repository
+    recorded = sum(1 for entry in counting.entries if entry["user_id"] == user_id)
+    print(f"📊 {label}")
+    print(f"   throughput:         {args.purchases / elapsed:.0f} purchases/s")
+    print(f"   p50 / p99 latency:  {percentile(latencies, 50) * 1000:.2f} ms / {percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"   insert calls:       {counting.calls} ({counting.calls / args.purchases:.3f} per purchase)")
+    if recorded == args.purchases:
+        print(f"   ✅ all {recorded} purchases recorded")
+        return True
+    print(f"   ❌ {recorded} of {args.purchases} purchases recorded")
+    return False
+
+
+def new_ledger(durability):
+    return ledger.Ledger(settings.LEDGER_BATCH_SIZE, settings.LEDGER_FLUSH_SECONDS, settings.LEDGER_MAX_PENDING, durability)
+
+
+async def main(args):
+    await database.open_storage()
+    sweet_ids = []
+    try:
+        for n in range(args.sweets):
+            sweet = await crud.create_sweet(
+                SweetCreate(name=f"bench-ledger-{n}", category="bench", price=1.0, quantity=args.purchases * 3)
+            )
+            sweet_ids.append(sweet["id"])
+        ok = True
+        for label, writer in (("inline", new_ledger("buffered")), ("buffered", new_ledger("buffered")), ("sync", new_ledger("sync"))):
+            ok = await run(label, writer, sweet_ids, args) and ok
+    finally:
+        for sweet_id in sweet_ids:
+            await crud.delete_sweet(sweet_id)
+        if settings.STORAGE_BACKEND != "memory":
+            await database.db.ledger.delete_many({"sweet_id": {"$in": [ObjectId(i) for i in sweet_ids]}})
+        await database.close_storage()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=5000)
+    parser.add_argument("--sweets", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=256)
+    ok = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,73 @@
+"""
+Login storm benchmark.
+Measures catalog-read latency (GET /api/sweets) on its own and while a
+storm of concurrent logins is hashing passwords, in-process over ASGI.
+Logins shed by the hashing queue limit (503) are counted separately.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/login_storm.py --logins 200 --reads 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import crud, database
+from app.auth import create_access_token, get_password_hash, shutdown_hash_pool
+from app.main import app
+from benchmarks.stats import percentile
+
+
+async def reads(client, headers, count):
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        resp = await client.get("/api/sweets", headers=headers)
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+async def storm(client, email, count):
+    credentials = {"email": email, "password": "storm-password"}
+    responses = await asyncio.gather(*(client.post("/api/auth/login", json=credentials) for _ in range(count)))
+    statuses = [resp.status_code for resp in responses]
+    return statuses.count(200), statuses.count(503)
+
+
+def report(label, latencies):
+    print(f"📊 {label}: p50 {percentile(latencies, 50) * 1000:.2f} ms, p99 {percentile(latencies, 99) * 1000:.2f} ms")
+
+
+async def main(args):
+    await database.open_storage()
+    email = f"storm-{os.getpid()}@example.com"
+    user = None
+    try:
+        user = await crud.create_user(email, await get_password_hash("storm-password"), False)
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user['_id'])})}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            report("catalog reads, idle", await reads(client, headers, args.reads))
+            latencies, (accepted, shed) = await asyncio.gather(
+                reads(client, headers, args.reads), storm(client, email, args.logins)
+            )
+            report("catalog reads, login storm", latencies)
+            print(f"   logins accepted: {accepted}, shed with 503: {shed}")
+    finally:
+        if user:
+            await database.users.delete(user["_id"])
+        shutdown_hash_pool()
+        await database.close_storage()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
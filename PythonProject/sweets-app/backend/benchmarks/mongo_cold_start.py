@@ -0,0 +1,96 @@
+"""
+MongoDB cold-start benchmark.
+Opens storage the way a freshly started worker does, then fires its first
+burst of catalog reads (listing pages and single sweets) all at once:
+
+  cold       MONGO_MIN_POOL_SIZE=0, the burst opens the connections it needs
+  prewarmed  MONGO_MIN_POOL_SIZE=--pool, startup waits for them instead
+
+Connection setup (TCP, TLS, authentication) shows up in the burst's latency
+when cold and in startup time when prewarmed. Reads go to the repository, so
+the catalog cache does not hide them. MONGO_COMPRESSORS and the other MONGO_*
+settings in .env apply to both.
+
+Needs MongoDB. The catalog is seeded into a scratch "<MONGO_DB_NAME>_bench"
+database that is dropped afterwards. Run from the backend directory:
+    python benchmarks/mongo_cold_start.py --pool 20 --burst 50 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import database
+from app.config import settings
+from app.repository import SweetQuery
+from benchmarks import seed
+from benchmarks.stats import percentile
+
+
+async def cold_start(min_pool_size, args):
+    settings.MONGO_MIN_POOL_SIZE = min_pool_size
+    started = time.perf_counter()
+    await database.open_storage()
+    startup = time.perf_counter() - started
+    latencies = []
+
+    async def read(n):
+        started = time.perf_counter()
+        if n % 2:
+            await database.sweets.find(SweetQuery(), None, 100)
+        else:
+            await database.sweets.get_for_display(seed.sweet_id(n % args.sweets))
+        latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(read(n) for n in range(args.burst)))
+        burst = time.perf_counter() - started
+    finally:
+        await database.close_storage()
+    return startup, burst, latencies
+
+
+async def main(args):
+    if settings.STORAGE_BACKEND != "mongo":
+        print("❌ Needs STORAGE_BACKEND=mongo")
+        return False
+    settings.MONGO_DB_NAME = f"{settings.MONGO_DB_NAME}_bench"
+    await database.open_storage()
+    try:
+        await database.client.drop_database(settings.MONGO_DB_NAME)
+        await database.sweets.ensure_indexes()
+        await seed.seed_catalog(args.sweets)
+    finally:
+        await database.close_storage()
+    try:
+        for label, min_pool_size in (("cold", 0), ("prewarmed", args.pool)):
+            startups, bursts, latencies = [], [], []
+            for _ in range(args.rounds):
+                startup, burst, samples = await cold_start(min_pool_size, args)
+                startups.append(startup)
+                bursts.append(burst)
+                latencies.extend(samples)
+            print(f"📊 {label} (min pool {min_pool_size}, {args.rounds} starts)")
+            print(f"   startup:            {percentile(startups, 50) * 1000:.1f} ms median")
+            print(f"   first {args.burst} reads:     {percentile(bursts, 50) * 1000:.1f} ms median")
+            print(f"   p50 / p99 latency:  {percentile(latencies, 50) * 1000:.2f} ms / {percentile(latencies, 99) * 1000:.2f} ms")
+    finally:
+        settings.MONGO_MIN_POOL_SIZE = 0
+        await database.open_storage()
+        await database.client.drop_database(settings.MONGO_DB_NAME)
+        await database.close_storage()
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sweets", type=int, default=10_000)
+    parser.add_argument("--pool", type=int, default=20, help="MONGO_MIN_POOL_SIZE when prewarmed")
+    parser.add_argument("--burst", type=int, default=50, help="concurrent reads right after startup")
+    parser.add_argument("--rounds", type=int, default=5)
+    ok = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if ok else 1)
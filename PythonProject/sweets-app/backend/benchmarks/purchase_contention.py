@@ -0,0 +1,91 @@
+"""
+Purchase contention benchmark.
+Fires thousands of concurrent purchases at a single sweet and checks that
+stock never goes negative, comparing the old read-check-$inc path with the
+atomic conditional decrement in crud.purchase_sweet.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/purchase_contention.py --purchases 5000 --stock 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crud, database, ledger
+from app.schemas import SweetCreate
+from benchmarks.stats import percentile
+
+
+async def legacy_purchase(sweet_id, quantity):
+    # The pre-atomic path: one read, a Python-side check, then an unconditional increment.
+    sweet = await database.sweets.get(sweet_id)
+    if not sweet or sweet["quantity"] < quantity:
+        return False
+    await database.sweets.add(sweet_id, -quantity)
+    return True
+
+
+async def atomic_purchase(sweet_id, quantity):
+    try:
+        return await crud.purchase_sweet(sweet_id, quantity) is not None
+    except crud.InsufficientStock:
+        return False
+
+
+async def run(label, purchase, purchases, stock, concurrency):
+    sweet = await crud.create_sweet(SweetCreate(name=f"bench-{label}", category="bench", price=1.0, quantity=stock))
+    sweet_id = sweet["id"]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await purchase(sweet_id, 1)
+            latencies.append(time.perf_counter() - started)
+            return ok
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(purchases)))
+    elapsed = time.perf_counter() - started
+
+    final = (await database.sweets.get(sweet_id))["quantity"]
+    await crud.delete_sweet(sweet_id)
+
+    sold = sum(results)
+    print(f"📊 {label}")
+    print(f"   accepted purchases: {sold} (stock was {stock})")
+    print(f"   final quantity:     {final}")
+    print(f"   throughput:         {purchases / elapsed:.0f} purchases/s")
+    print(f"   p50 / p99 latency:  {percentile(latencies, 50) * 1000:.2f} ms / {percentile(latencies, 99) * 1000:.2f} ms")
+    if final < 0 or sold > stock:
+        print("   ❌ oversold!")
+    else:
+        print("   ✅ stock never went negative")
+    return final >= 0 and sold <= stock
+
+
+async def main(args):
+    await database.open_storage()
+    # Stock changes are recorded by the background writer, as in the app.
+    ledger.inventory.start()
+    try:
+        await run("legacy read-check-inc", legacy_purchase, args.purchases, args.stock, args.concurrency)
+        ok = await run("atomic conditional decrement", atomic_purchase, args.purchases, args.stock, args.concurrency)
+    finally:
+        await ledger.inventory.stop()
+        await database.close_storage()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=5000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    ok = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if ok else 1)
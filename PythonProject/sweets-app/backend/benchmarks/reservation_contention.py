@@ -0,0 +1,125 @@
+"""
+Hot-SKU contention benchmark.
+Fires concurrent single-unit purchases at one sweet with its stock on a
+single counter, then split over --shards counters (POST
+/api/sweets/{id}/shards), and checks that exactly the stock was sold. Then
+runs the reservation flow on the split sweet: every shopper reserves, half
+confirm and half abandon their hold, and the sweeper must return the
+abandoned stock.
+
+Against MongoDB every purchase of a single-counter sweet updates the same
+document, so they queue on its write lock; split counters spread that out.
+The in-memory engine has no lock contention and shows only the overhead.
+
+Run from the backend directory (uses the storage backend configured in .env):
+    python benchmarks/reservation_contention.py --purchases 5000 --shards 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import crud, database, ledger
+from app.schemas import SweetCreate
+from benchmarks.purchase_contention import atomic_purchase
+from benchmarks.stats import percentile
+
+
+async def timed(calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(call):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await call()
+            latencies.append(time.perf_counter() - started)
+            return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(call) for call in calls))
+    return results, time.perf_counter() - started, latencies
+
+
+def report(label, count, elapsed, latencies):
+    print(f"📊 {label}")
+    print(f"   throughput:         {count / elapsed:.0f} ops/s")
+    print(f"   p50 / p99 latency:  {percentile(latencies, 50) * 1000:.2f} ms / {percentile(latencies, 99) * 1000:.2f} ms")
+
+
+async def purchases(label, shards, args):
+    sweet = await crud.create_sweet(SweetCreate(name=f"bench-{label}", category="bench", price=1.0, quantity=args.stock))
+    sweet_id = sweet["id"]
+    try:
+        await crud.split_stock(sweet_id, shards)
+        calls = [lambda: atomic_purchase(sweet_id, 1)] * args.purchases
+        results, elapsed, latencies = await timed(calls, args.concurrency)
+        final = (await database.sweets.get(sweet_id))["quantity"]
+    finally:
+        await crud.delete_sweet(sweet_id)
+    sold = sum(results)
+    report(label, args.purchases, elapsed, latencies)
+    print(f"   sold {sold} of {args.stock}, {final} left")
+    ok = sold == min(args.stock, args.purchases) and final == args.stock - sold
+    print("   ✅ stock accounted for" if ok else "   ❌ stock lost or oversold!")
+    return ok
+
+
+async def reservations(args):
+    holds = min(args.purchases, args.stock)
+    sweet = await crud.create_sweet(SweetCreate(name="bench-reservations", category="bench", price=1.0, quantity=args.stock))
+    sweet_id = sweet["id"]
+    try:
+        await crud.split_stock(sweet_id, args.shards)
+        calls = [lambda n=n: crud.reserve_sweet(sweet_id, 1, f"shopper-{n}") for n in range(holds)]
+        reserved, elapsed, latencies = await timed(calls, args.concurrency)
+        report(f"reserve over {args.shards} counters", holds, elapsed, latencies)
+
+        confirm = [lambda r=r: crud.confirm_reservation(r["id"], r["user_id"]) for r in reserved[::2]]
+        confirmed, elapsed, latencies = await timed(confirm, args.concurrency)
+        report("confirm", len(confirm), elapsed, latencies)
+
+        # Expire the abandoned holds instead of waiting out RESERVATION_TTL_SECONDS.
+        abandoned = reserved[1::2]
+        for reservation in abandoned:
+            await database.reservations.pop(reservation["id"], reservation["user_id"])
+            reservation["expires_at"] = datetime.now(timezone.utc)
+            await database.reservations.insert(reservation)
+        started = time.perf_counter()
+        reclaimed = await crud.reclaim_expired_reservations()
+        print(f"📊 sweeper reclaimed {reclaimed} holds in {(time.perf_counter() - started) * 1000:.0f} ms")
+        final = (await database.sweets.get(sweet_id))["quantity"]
+    finally:
+        await crud.delete_sweet(sweet_id)
+    ok = all(confirmed) and reclaimed == len(abandoned) and final == args.stock - len(confirmed)
+    print(f"   {len(confirmed)} confirmed, {final} left of {args.stock}")
+    print("   ✅ abandoned stock returned" if ok else "   ❌ stock lost!")
+    return ok
+
+
+async def main(args):
+    await database.open_storage()
+    # Stock changes are recorded by the background writer, as in the app.
+    ledger.inventory.start()
+    try:
+        ok = await purchases("single counter", 1, args)
+        ok = await purchases(f"{args.shards} counters", args.shards, args) and ok
+        ok = await reservations(args) and ok
+    finally:
+        await ledger.inventory.stop()
+        await database.close_storage()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--purchases", type=int, default=5000)
+    parser.add_argument("--stock", type=int, default=4000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=256)
+    ok = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,178 @@
+"""
+Load-testing harness for the API.
+Seeds a deterministic catalog, drives the scenario mixes from
+benchmarks/harness.py through the app and reports throughput, latency
+percentiles and storage round trips per request. --output writes the results
+as JSON so runs can be diffed between commits with benchmarks/compare.py.
+In-process the app runs under its lifespan, so the ledger writer, the
+reservation sweeper and the other background tasks run as in production.
+
+  --transport asgi     the app runs in this process (no network, no workers)
+  --transport uvicorn  the app runs in uvicorn worker processes on localhost
+
+Against MongoDB the catalog is seeded into a scratch "<MONGO_DB_NAME>_bench"
+database that is dropped afterwards. Round trips are only counted in-process.
+
+Run from the backend directory:
+    python benchmarks/run.py --sweets 100000 --output before.json
+    python benchmarks/run.py --transport uvicorn --workers 4 --scenario browse --scenario purchase
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import cache, database, ledger
+from app.config import settings
+from app.main import app
+from benchmarks import harness, seed
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def round_trips(counter):
+    if settings.STORAGE_BACKEND == "memory":
+        return database.store.operations
+    return counter.count
+
+
+async def wait_until_up(base_url, timeout=600):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get("/docs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.5)
+    raise RuntimeError("uvicorn did not start in time")
+
+
+def start_uvicorn(args):
+    env = dict(os.environ, BENCH_SWEETS=str(args.sweets), MONGO_DB_NAME=settings.MONGO_DB_NAME)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.server:create_app", "--factory",
+         "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def run_scenarios(client, args, tokens, counter):
+    results = {}
+    for name in args.scenario:
+        scenario = harness.SCENARIOS[name]
+        total = args.requests or scenario.requests
+        print(f"🏃 {name}: {scenario.description} ({total} requests, concurrency {args.concurrency})")
+        cache.invalidate_all()
+        before = round_trips(counter) if counter else None
+        result = await harness.run(client, scenario, args.sweets, tokens, total, args.concurrency, args.seed)
+        # Lets the ledger writer flush this scenario's last batch, so its
+        # round trips are counted here rather than in the next scenario.
+        await asyncio.sleep(settings.LEDGER_FLUSH_SECONDS)
+        if counter:
+            result["round_trips_per_request"] = round((round_trips(counter) - before) / total, 3)
+        else:
+            # Happens in the worker processes, out of reach from here.
+            result["round_trips_per_request"] = None
+        latency = result["latency_ms"]
+        trips = result["round_trips_per_request"]
+        print(f"   {result['throughput']} req/s, p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+              f"p99 {latency['p99']} ms, round trips/request {trips if trips is not None else 'n/a'}, "
+              f"statuses {result['statuses']}")
+        results[name] = result
+    return results
+
+
+async def load_test(args, counter):
+    server = None
+    try:
+        if settings.STORAGE_BACKEND != "memory":
+            await database.client.drop_database(settings.MONGO_DB_NAME)
+            await database.sweets.ensure_indexes()
+        if settings.STORAGE_BACKEND != "memory" or args.transport == "asgi":
+            started = time.perf_counter()
+            await seed.seed(args.sweets)
+            print(f"🌱 Seeded {args.sweets} sweets in {time.perf_counter() - started:.1f}s")
+        tokens = seed.tokens()
+        if args.transport == "asgi":
+            # ASGITransport does not run the lifespan; main() does.
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                return await run_scenarios(client, args, tokens, counter)
+        server = start_uvicorn(args)
+        base_url = f"http://127.0.0.1:{args.port}"
+        await wait_until_up(base_url)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+            return await run_scenarios(client, args, tokens, None)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        if settings.STORAGE_BACKEND != "memory":
+            # Written before the scratch database goes, not into it afterwards.
+            await ledger.inventory.stop()
+            await database.client.drop_database(settings.MONGO_DB_NAME)
+
+
+async def main(args):
+    if settings.STORAGE_BACKEND != "memory":
+        settings.MONGO_DB_NAME = f"{settings.MONGO_DB_NAME}_bench"
+    counter = harness.RoundTripCounter()
+    database.event_listeners.append(counter)
+    async with app.router.lifespan_context(app):
+        results = await load_test(args, counter)
+    if args.output:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "backend": settings.STORAGE_BACKEND,
+                "transport": args.transport,
+                "workers": args.workers if args.transport == "uvicorn" else None,
+                "sweets": args.sweets,
+                "concurrency": args.concurrency,
+                "seed": args.seed,
+            },
+            "scenarios": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(harness.SCENARIOS),
+                        help="scenario to run, repeatable (default: all)")
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sweets", type=int, default=10_000, help="catalog size, 100 to 1000000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, help="requests per scenario (default: per-scenario)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(harness.SCENARIOS)
+    asyncio.run(main(args))
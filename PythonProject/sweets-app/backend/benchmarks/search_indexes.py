@@ -0,0 +1,100 @@
+"""
+Search index benchmark.
+Seeds a large catalog into a scratch database, checks with explain() that
+every search shape produced for crud.search_sweets, including the OR text
+mode, is index-backed (no COLLSCAN), and times it against the old
+unanchored case-insensitive regex.
+
+Needs STORAGE_BACKEND=mongo. Run from the backend directory (uses the
+MongoDB server configured in .env):
+    python benchmarks/search_indexes.py --sweets 1000000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import database
+from app.config import settings
+from app.repository import SweetQuery, mongo_filter
+from benchmarks import seed
+
+SHAPES = [
+    ("name prefix", {"name": "car"}),
+    ("category prefix", {"category": "choc"}),
+    ("category + price range", {"category": "toffee", "min_price": 10, "max_price": 50}),
+    ("price range", {"min_price": 100, "max_price": 110}),
+    ("name or category prefix", {"text": "car"}),
+    ("name-scoped text + price range", {"text": "mi", "text_fields": ["name"], "min_price": 10, "max_price": 50}),
+    ("hostile pattern", {"name": "(a+)+$"}),
+]
+
+
+def stages(plan):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from stages(child)
+
+
+def legacy_query(name=None, category=None, min_price=None, max_price=None, text=None, text_fields=("name", "category")):
+    query = {}
+    if name:
+        query["name"] = {"$regex": name, "$options": "i"}
+    if category:
+        query["category"] = {"$regex": category, "$options": "i"}
+    if text:
+        query["$or"] = [{field: {"$regex": text, "$options": "i"}} for field in text_fields]
+    if min_price is not None or max_price is not None:
+        query["price"] = {k: v for k, v in (("$gte", min_price), ("$lte", max_price)) if v is not None}
+    return query
+
+
+async def timed(query, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await database.db.sweets.find(query).sort("_id", 1).limit(101).to_list(101)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+async def main(args):
+    settings.MONGO_DB_NAME = f"{settings.MONGO_DB_NAME}_search_bench"
+    await database.open_storage()
+    ok = True
+    try:
+        if await database.db.sweets.estimated_document_count() < args.sweets:
+            print(f"🌱 seeding {args.sweets} sweets...")
+            await database.db.sweets.delete_many({})
+            # The load harness's catalog, so the shapes match what it searches.
+            await seed.seed_catalog(args.sweets)
+        await database.sweets.ensure_indexes()
+
+        for label, params in SHAPES:
+            query = mongo_filter(SweetQuery.build(**params))
+            explained = await database.db.command(
+                "explain", {"find": "sweets", "filter": query, "sort": {"_id": 1}, "limit": 101},
+                verbosity="queryPlanner",
+            )
+            plan = set(stages(explained["queryPlanner"]["winningPlan"]))
+            indexed = "COLLSCAN" not in plan
+            ok &= indexed
+            print(f"{'✅' if indexed else '❌'} {label}: {' > '.join(sorted(s for s in plan if s))}")
+            print(f"   indexed {await timed(query):.1f} ms, legacy regex {await timed(legacy_query(**params)):.1f} ms")
+    finally:
+        if not args.keep:
+            await database.client.drop_database(settings.MONGO_DB_NAME)
+        await database.close_storage()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sweets", type=int, default=1_000_000)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database for the next run")
+    ok = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if ok else 1)
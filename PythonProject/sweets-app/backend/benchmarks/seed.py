@@ -0,0 +1,69 @@
+"""
+Deterministic seed data for the benchmark harness.
+Sweets and users get fixed ObjectIds derived from their index, so every
+process (and every uvicorn worker on the in-memory engine) seeds the same
+catalog and tokens minted by the harness are valid everywhere.
+"""
+import random
+
+from bson import ObjectId
+
+from app import database
+from app.auth import create_access_token, get_password_hash
+
+CATEGORIES = ["Chocolate", "Candy", "Toffee", "Gummy", "Pastry", "Fudge", "Marzipan", "Licorice", "Nougat", "Brittle"]
+WORDS = ["dark", "milk", "sour", "berry", "mint", "caramel", "honey", "nutty", "royal", "tiny", "golden", "fizzy"]
+
+ADMIN_ID = ObjectId("a" * 24)
+SHOPPER_ID = ObjectId("b" * 24)
+SHOPPER_EMAIL = "shopper@bench.local"
+PASSWORD = "bench-password"
+HOT_SKUS = 5
+BATCH = 10_000
+
+
+def sweet_id(n):
+    return ObjectId(f"{n + 1:024x}")
+
+
+def sweets(count, seed=42):
+    rng = random.Random(seed)
+    for n in range(count):
+        name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {n}"
+        category = rng.choice(CATEGORIES)
+        # Hot SKUs start with plenty of stock so contention runs don't sell out.
+        quantity = 10**9 if n < HOT_SKUS else rng.randrange(0, 500)
+        yield {
+            "_id": sweet_id(n), "name": name, "category": category,
+            "name_lower": name.lower(), "category_lower": category.lower(),
+            "price": rng.randrange(1, 1000) / 4, "quantity": quantity,
+        }
+
+
+async def seed_catalog(count):
+    batch = []
+    for doc in sweets(count):
+        batch.append(doc)
+        if len(batch) == BATCH:
+            await database.sweets.insert_many(batch)
+            batch = []
+    if batch:
+        await database.sweets.insert_many(batch)
+
+
+async def seed_users():
+    hashed = await get_password_hash(PASSWORD)
+    await database.users.insert({"_id": ADMIN_ID, "email": "admin@bench.local", "hashed_password": hashed, "is_admin": True})
+    await database.users.insert({"_id": SHOPPER_ID, "email": SHOPPER_EMAIL, "hashed_password": hashed, "is_admin": False})
+
+
+async def seed(count):
+    await seed_users()
+    await seed_catalog(count)
+
+
+def tokens():
+    return {
+        "admin": create_access_token({"sub": str(ADMIN_ID), "is_admin": True}),
+        "shopper": create_access_token({"sub": str(SHOPPER_ID), "is_admin": False}),
+    }
@@ -0,0 +1,80 @@
+"""
+Serialization benchmark.
+CPU time to turn 1,000 sweets into a listing response, old path versus fast
+path, through a real FastAPI app in-process over ASGI. Each request
+BSON-decodes the documents first, the part of the driver's work that
+projections change.
+
+  before  full documents, "id" added in Python, response_model=list[SweetOut]
+          validation and FastAPI's encoder
+  after   projected documents with "id" converted by the server, encoded
+          as-is with orjson (main.FastJSONResponse)
+
+Needs no database. Run from the backend directory:
+    python benchmarks/serialization.py --sweets 1000 --rounds 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+import httpx
+from fastapi import FastAPI
+
+from app.main import FastJSONResponse
+from app.repository import LISTED_FIELDS
+from app.schemas import SweetOut
+from benchmarks import seed
+
+
+def build_app(count):
+    docs = list(seed.sweets(count))
+    full = [bson.encode(doc) for doc in docs]
+    projected = [
+        bson.encode({"id": str(doc["_id"]), **{field: doc[field] for field in LISTED_FIELDS}}) for doc in docs
+    ]
+    app = FastAPI()
+
+    @app.get("/before", response_model=list[SweetOut])
+    async def before():
+        sweets = [bson.decode(raw) for raw in full]
+        for sweet in sweets:
+            sweet["id"] = str(sweet["_id"])
+        return sweets
+
+    @app.get("/after", response_model=list[SweetOut])
+    async def after():
+        return FastJSONResponse([bson.decode(raw) for raw in projected])
+
+    return app
+
+
+async def cpu_per_request(client, path, rounds):
+    await client.get(path)
+    started = time.process_time()
+    for _ in range(rounds):
+        resp = await client.get(path)
+        resp.raise_for_status()
+    return (time.process_time() - started) / rounds, len(resp.content)
+
+
+async def main(args):
+    transport = httpx.ASGITransport(app=build_app(args.sweets))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        before, before_bytes = await cpu_per_request(client, "/before", args.rounds)
+        after, after_bytes = await cpu_per_request(client, "/after", args.rounds)
+    per_thousand = 1000 / args.sweets
+    print(f"📊 before: {before * per_thousand * 1000:.2f} ms CPU per 1,000 sweets ({before_bytes} bytes)")
+    print(f"📊 after:  {after * per_thousand * 1000:.2f} ms CPU per 1,000 sweets ({after_bytes} bytes)")
+    print(f"⚡ {before / after:.1f}x less CPU")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sweets", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
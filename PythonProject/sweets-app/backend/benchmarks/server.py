@@ -0,0 +1,28 @@
+"""
+App factory for running the benchmarks against real uvicorn workers:
+    uvicorn benchmarks.server:create_app --factory --workers 4
+
+With STORAGE_BACKEND=memory every worker seeds its own copy of the
+deterministic catalog (BENCH_SWEETS sweets) on startup. Against MongoDB the
+catalog is seeded once by benchmarks/run.py before the workers start.
+"""
+import os
+from contextlib import asynccontextmanager
+
+from app.config import settings
+from app.main import app
+from benchmarks import seed
+
+
+def create_app():
+    lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def seeded_lifespan(application):
+        async with lifespan(application):
+            if settings.STORAGE_BACKEND == "memory":
+                await seed.seed(int(os.environ.get("BENCH_SWEETS", "10000")))
+            yield
+
+    app.router.lifespan_context = seeded_lifespan
+    return app
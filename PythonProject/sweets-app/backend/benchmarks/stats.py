@@ -0,0 +1,10 @@
+"""
+Summary statistics shared by the benchmark scripts, here and in
+frontend/benchmarks. Imports nothing from the app, so the frontend's
+scripts can use it without the backend's dependencies.
+"""
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
@@ -0,0 +1,81 @@
+"""
+Production entry point for the FastAPI application.
+Runs one worker process per available core (WEB_WORKERS overrides it) with
+uvloop and httptools when they are installed, and drains on SIGTERM. Host,
+port and the other server settings come from .env, see app/config.py.
+Use run.py for development.
+
+Each worker keeps its own catalog cache and event broadcaster; they only
+see the other workers' writes with CACHE_CHANGE_STREAM and
+EVENTS_CHANGE_STREAM, which need MongoDB as a replica set. Without them
+a single worker is started by default.
+"""
+import importlib.util
+import os
+import sys
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+os.chdir(backend_dir)
+sys.path.insert(0, backend_dir)
+
+from app.config import settings
+
+
+def cpu_quota():
+    # A container limited with --cpus still sees every core of the host.
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        return None
+    if quota == "max":
+        return None
+    return max(1, int(quota) // int(period))
+
+
+def available_cores():
+    # Respects taskset and cpusets, unlike os.cpu_count().
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = cpu_quota()
+    return min(cores, quota) if quota else cores
+
+
+def workers_share_changes():
+    return settings.STORAGE_BACKEND == "mongo" and settings.CACHE_CHANGE_STREAM and settings.EVENTS_CHANGE_STREAM
+
+
+def worker_count():
+    # The app is async, so one worker per core keeps every core busy; argon2
+    # hashing has its own pool (HASH_WORKERS) per worker.
+    if settings.WEB_WORKERS > 0:
+        return settings.WEB_WORKERS
+    return available_cores() if workers_share_changes() else 1
+
+
+if __name__ == "__main__":
+    import uvicorn
+    workers = worker_count()
+    if workers > 1 and not workers_share_changes():
+        print(
+            f"⚠️  WARNING: {workers} workers without CACHE_CHANGE_STREAM and EVENTS_CHANGE_STREAM on MongoDB.\n"
+            "   Each worker only sees its own writes: others serve stale listings (and 304s) for up to\n"
+            "   CACHE_TTL_SECONDS, and live updates miss most changes. Enable both, or set WEB_WORKERS=1."
+        )
+    # Read by each worker to share MONGO_MAX_CONNECTIONS out between them.
+    os.environ["WEB_WORKERS"] = str(workers)
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    print(f"🚀 Starting {workers} worker(s) on http://{settings.WEB_HOST}:{settings.WEB_PORT} ({loop}, {http})")
+    uvicorn.run(
+        "app.main:app",
+        host=settings.WEB_HOST,
+        port=settings.WEB_PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=settings.WEB_BACKLOG,
+        timeout_keep_alive=settings.WEB_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=settings.WEB_GRACEFUL_SECONDS,
+        # GET /metrics already counts requests per route.
+        access_log=False,
+    )
@@ -1,7 +1,7 @@
-@echo off
-echo Starting FastAPI Backend Server...
-echo.
-cd /d %~dp0
-python run.py
-pause
-
+@echo off
+echo Starting FastAPI Backend Server...
+echo.
+cd /d %~dp0
+python run.py
+pause
+
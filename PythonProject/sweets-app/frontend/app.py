@@ -1,178 +1,204 @@
-import streamlit as st
-import requests
-import jwt
-
-BASE_URL = "http://127.0.0.1:8000"
-
-# --- Session management ---
-if "token" not in st.session_state:
-    st.session_state.token = None
-if "is_admin" not in st.session_state:
-    st.session_state.is_admin = False
-
-# --- Helpers ---
-def get_headers():
-    if st.session_state.token:
-        return {"Authorization": f"Bearer {st.session_state.token}"}
-    return {}
-
-def handle_response(resp):
-    if resp.status_code in (200, 201):
-        st.success("Action successful")
-        if resp.status_code == 201:
-            st.rerun()
-    else:
-        try:
-            error_detail = resp.json().get("detail", "Error")
-            st.error(f"Error: {error_detail}")
-        except Exception as e:
-            st.error(f"Something went wrong: Status {resp.status_code}")
-
-# --- Authentication ---
-def register_ui():
-    st.subheader("Register New User")
-    email = st.text_input("Email")
-    password = st.text_input("Password", type="password", max_chars=200)
-    is_admin = st.checkbox("Register as Admin")
-    if st.button("Register"):
-        try:
-            resp = requests.post(f"{BASE_URL}/api/auth/register", json={
-                "email": email, "password": password, "is_admin": is_admin
-            }, timeout=5)
-            handle_response(resp)
-        except requests.exceptions.ConnectionError:
-            st.error("Backend server is not running")
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
-
-def login_ui():
-    st.subheader("Login")
-    email = st.text_input("Email")
-    password = st.text_input("Password", type="password", max_chars=200)
-    if st.button("Login"):
-        try:
-            resp = requests.post(f"{BASE_URL}/api/auth/login", json={
-                "email": email, "password": password
-            }, timeout=5)
-            if resp.status_code == 200:
-                token_data = resp.json()
-                st.session_state.token = token_data["access_token"]
-                payload = jwt.decode(token_data["access_token"], options={"verify_signature": False})
-                st.session_state.is_admin = payload.get("is_admin", False)
-                st.success("Logged in successfully")
-                st.rerun()
-            else:
-                handle_response(resp)
-        except requests.exceptions.ConnectionError:
-            st.error("Backend server is not running")
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
-
-def logout_ui():
-    if st.button("Logout"):
-        st.session_state.token = None
-        st.session_state.is_admin = False
-        st.success("Logged out")
-        st.rerun()
-
-# --- Main Dashboard ---
-def dashboard():
-    st.title("🍬 Sweets Shop")
-    logout_ui()
-
-    st.subheader("Available Sweets")
-    query = st.text_input("Search by name or category")
-    min_price = st.number_input("Min Price", min_value=0.0, step=1.0)
-    max_price = st.number_input("Max Price", min_value=0.0, step=1.0)
-
-    if st.button("Search"):
-        params = {}
-        if query:
-            params["name"] = query
-            params["category"] = query
-        if min_price:
-            params["min_price"] = min_price
-        if max_price:
-            params["max_price"] = max_price
-        resp = requests.get(f"{BASE_URL}/api/sweets/search", headers=get_headers(), params=params)
-    else:
-        resp = requests.get(f"{BASE_URL}/api/sweets", headers=get_headers())
-
-    if resp.status_code == 200:
-        sweets = resp.json()
-        for sweet in sweets:
-            with st.container(border=True):
-                st.markdown(f"### {sweet['name']}")
-                st.write(f"**Category:** {sweet['category']}")
-                st.write(f"**Price:** ₹{sweet['price']}")
-                st.write(f"**Quantity:** {sweet['quantity']}")
-                if sweet['quantity'] <= 0:
-                    st.button("Out of Stock", disabled=True, key=sweet['id'])
-                else:
-                    if st.button("Purchase", key=f"p-{sweet['id']}"):
-                        p = requests.post(f"{BASE_URL}/api/sweets/{sweet['id']}/purchase", headers=get_headers())
-                        handle_response(p)
-                        st.rerun()
-
-    else:
-        st.error("Unable to fetch sweets")
-
-    # --- Admin Section ---
-    if st.session_state.is_admin:
-        st.markdown("---")
-        st.subheader("🛠️ Admin Panel")
-
-        tabs = st.tabs(["Add Sweet", "Update Sweet", "Delete Sweet", "Restock Sweet"])
-
-        # Add Sweet
-        with tabs[0]:
-            name = st.text_input("Name", key="add_name")
-            category = st.text_input("Category", key="add_cat")
-            price = st.number_input("Price", min_value=0.0, key="add_price")
-            qty = st.number_input("Quantity", min_value=0, key="add_qty")
-            if st.button("Add Sweet"):
-                data = {"name": name, "category": category, "price": price, "quantity": qty}
-                resp = requests.post(f"{BASE_URL}/api/sweets", headers=get_headers(), json=data)
-                handle_response(resp)
-                st.rerun()
-
-        # Update Sweet
-        with tabs[1]:
-            sweet_id = st.text_input("Sweet ID to Update")
-            name = st.text_input("New Name")
-            category = st.text_input("New Category")
-            price = st.number_input("New Price", min_value=0.0)
-            qty = st.number_input("New Quantity", min_value=0)
-            if st.button("Update Sweet"):
-                data = {"name": name, "category": category, "price": price, "quantity": qty}
-                resp = requests.put(f"{BASE_URL}/api/sweets/{sweet_id}", headers=get_headers(), json=data)
-                handle_response(resp)
-                st.rerun()
-
-        # Delete Sweet
-        with tabs[2]:
-            sweet_id = st.text_input("Sweet ID to Delete")
-            if st.button("Delete Sweet"):
-                resp = requests.delete(f"{BASE_URL}/api/sweets/{sweet_id}", headers=get_headers())
-                handle_response(resp)
-                st.rerun()
-
-        # Restock Sweet
-        with tabs[3]:
-            sweet_id = st.text_input("Sweet ID to Restock")
-            qty = st.number_input("Restock Quantity", min_value=1)
-            if st.button("Restock"):
-                resp = requests.post(f"{BASE_URL}/api/sweets/{sweet_id}/restock", headers=get_headers(), params={"quantity": qty})
-                handle_response(resp)
-                st.rerun()
-
-# --- Routing ---
-st.sidebar.title("🍭 Sweets App")
-if not st.session_state.token:
-    page = st.sidebar.radio("Menu", ["Login", "Register"])
-    if page == "Login":
-        login_ui()
-    else:
-        register_ui()
-else:
-    dashboard()
+import streamlit as st
+import requests
+import jwt
+
+from client import ApiClient, new_session
+
+# With live updates on, the catalog redraws from the event-patched cache this often.
+LIVE_REFRESH_SECONDS = 2
+
+@st.cache_resource
+def shared_session():
+    # One connection pool for the whole server instead of a TCP connect per call.
+    return new_session()
+
+# --- Session management ---
+if "api" not in st.session_state:
+    st.session_state.api = ApiClient(shared_session())
+if "is_admin" not in st.session_state:
+    st.session_state.is_admin = False
+api = st.session_state.api
+
+def handle_response(resp):
+    if resp.status_code in (200, 201):
+        st.success("Action successful")
+        if resp.status_code == 201:
+            st.rerun()
+    else:
+        try:
+            error_detail = resp.json().get("detail", "Error")
+            st.error(f"Error: {error_detail}")
+        except Exception as e:
+            st.error(f"Something went wrong: Status {resp.status_code}")
+
+# --- Authentication ---
+def register_ui():
+    st.subheader("Register New User")
+    email = st.text_input("Email")
+    password = st.text_input("Password", type="password", max_chars=200)
+    is_admin = st.checkbox("Register as Admin")
+    if st.button("Register"):
+        try:
+            resp = api.register(email, password, is_admin)
+            handle_response(resp)
+        except requests.exceptions.ConnectionError:
+            st.error("Backend server is not running")
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+
+def login_ui():
+    st.subheader("Login")
+    email = st.text_input("Email")
+    password = st.text_input("Password", type="password", max_chars=200)
+    if st.button("Login"):
+        try:
+            resp = api.login(email, password)
+            if resp.status_code == 200:
+                payload = jwt.decode(api.token, options={"verify_signature": False})
+                st.session_state.is_admin = payload.get("is_admin", False)
+                st.success("Logged in successfully")
+                st.rerun()
+            else:
+                handle_response(resp)
+        except requests.exceptions.ConnectionError:
+            st.error("Backend server is not running")
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+
+def logout_ui():
+    if st.button("Logout"):
+        api.stop_events()
+        api.logout()
+        st.session_state.is_admin = False
+        st.success("Logged out")
+        st.rerun()
+
+# --- Main Dashboard ---
+def price_range(bucket):
+    if bucket["min"] is None:
+        return f"under ₹{bucket['max']:g}"
+    if bucket["max"] is None:
+        return f"₹{bucket['min']:g}+"
+    return f"₹{bucket['min']:g}–{bucket['max']:g}"
+
+def category_picker(facets):
+    """A category select box with counts for the current search."""
+    counts = {c["category"]: c["count"] for c in facets["categories"]}
+    st.selectbox(
+        "Category", list(counts), index=None, key="category",
+        placeholder=f"All categories ({facets['total']} sweets, {facets['in_stock']} in stock)",
+        format_func=lambda c: f"{c} ({counts[c]})",
+    )
+    if facets["prices"]:
+        st.caption(" · ".join(f"{price_range(b)}: {b['count']}" for b in facets["prices"]))
+
+def sweets_section():
+    query = st.text_input("Search by name or category")
+    min_price = st.number_input("Min Price", min_value=0.0, step=1.0)
+    max_price = st.number_input("Max Price", min_value=0.0, step=1.0)
+    # The category and the Search button are read from the session state
+    # before they are drawn, so the facets and the sweets can be fetched
+    # together; the picker needs the facets to draw.
+    category = st.session_state.get("category")
+    search = st.session_state.get("search") or category is not None
+    (facets_status, facets), (status_code, sweets) = api.browse(query, min_price, max_price, category, search)
+    if facets_status == 200 and category is not None and category not in [c["category"] for c in facets["categories"]]:
+        # The search changed and no longer finds the chosen category.
+        st.session_state.category = None
+        if st.session_state.get("search"):
+            status_code, sweets = api.search(query, min_price, max_price)
+        else:
+            status_code, sweets = api.get_catalog("/api/sweets")
+    if facets_status == 200:
+        category_picker(facets)
+    st.button("Search", key="search")
+
+    if status_code == 200:
+        for sweet in sweets:
+            with st.container(border=True):
+                st.markdown(f"### {sweet['name']}")
+                st.write(f"**Category:** {sweet['category']}")
+                st.write(f"**Price:** ₹{sweet['price']}")
+                st.write(f"**Quantity:** {sweet['quantity']}")
+                if sweet['quantity'] <= 0:
+                    st.button("Out of Stock", disabled=True, key=sweet['id'])
+                else:
+                    if st.button("Purchase", key=f"p-{sweet['id']}"):
+                        p = api.mutate("POST", f"/api/sweets/{sweet['id']}/purchase")
+                        handle_response(p)
+                        st.rerun()
+
+    else:
+        st.error("Unable to fetch sweets")
+
+def dashboard():
+    st.title("🍬 Sweets Shop")
+    logout_ui()
+
+    if st.sidebar.toggle("Live stock updates", help="Follow stock changes pushed by the backend instead of refetching"):
+        api.follow_events()
+    else:
+        api.stop_events()
+
+    st.subheader("Available Sweets")
+    st.fragment(sweets_section, run_every=LIVE_REFRESH_SECONDS if api.live else None)()
+
+    # --- Admin Section ---
+    if st.session_state.is_admin:
+        st.markdown("---")
+        st.subheader("🛠️ Admin Panel")
+
+        tabs = st.tabs(["Add Sweet", "Update Sweet", "Delete Sweet", "Restock Sweet"])
+
+        # Add Sweet
+        with tabs[0]:
+            name = st.text_input("Name", key="add_name")
+            category = st.text_input("Category", key="add_cat")
+            price = st.number_input("Price", min_value=0.0, key="add_price")
+            qty = st.number_input("Quantity", min_value=0, key="add_qty")
+            if st.button("Add Sweet"):
+                data = {"name": name, "category": category, "price": price, "quantity": qty}
+                resp = api.mutate("POST", "/api/sweets", json=data)
+                handle_response(resp)
+                st.rerun()
+
+        # Update Sweet
+        with tabs[1]:
+            sweet_id = st.text_input("Sweet ID to Update")
+            name = st.text_input("New Name")
+            category = st.text_input("New Category")
+            price = st.number_input("New Price", min_value=0.0)
+            qty = st.number_input("New Quantity", min_value=0)
+            if st.button("Update Sweet"):
+                data = {"name": name, "category": category, "price": price, "quantity": qty}
+                resp = api.mutate("PUT", f"/api/sweets/{sweet_id}", json=data)
+                handle_response(resp)
+                st.rerun()
+
+        # Delete Sweet
+        with tabs[2]:
+            sweet_id = st.text_input("Sweet ID to Delete")
+            if st.button("Delete Sweet"):
+                resp = api.mutate("DELETE", f"/api/sweets/{sweet_id}")
+                handle_response(resp)
+                st.rerun()
+
+        # Restock Sweet
+        with tabs[3]:
+            sweet_id = st.text_input("Sweet ID to Restock")
+            qty = st.number_input("Restock Quantity", min_value=1)
+            if st.button("Restock"):
+                resp = api.mutate("POST", f"/api/sweets/{sweet_id}/restock", params={"quantity": qty})
+                handle_response(resp)
+                st.rerun()
+
+# --- Routing ---
+st.sidebar.title("🍭 Sweets App")
+if not api.token:
+    page = st.sidebar.radio("Menu", ["Login", "Register"])
+    if page == "Login":
+        login_ui()
+    else:
+        register_ui()
+else:
+    dashboard()
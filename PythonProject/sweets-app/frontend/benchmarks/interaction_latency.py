@@ -0,0 +1,118 @@
+"""
+Per-interaction latency of the Streamlit frontend's backend calls.
+Replays what the dashboard does on common interactions, once with bare
+requests.get/post calls (a new connection and a full catalog fetch per
+rerun) and once through client.ApiClient (pooled keep-alive session, cached
+catalog, one OR search fetched side by side with its facets):
+
+  rerun     a widget change reruns the script, which renders the catalog
+            and its facets
+  purchase  POST purchase, then the two reruns that follow it
+  search    name-or-category search (bare: a name and a category query)
+
+Needs a running backend (python run.py in sweets-app/backend). Creates an
+admin user and --sweets sweets, and deletes the sweets afterwards.
+
+Run from the frontend directory:
+    python benchmarks/interaction_latency.py --rounds 50
+"""
+import argparse
+import os
+import sys
+import time
+
+FRONTEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FRONTEND_DIR)
+# Last, so "app" is still the frontend's; benchmarks.stats imports nothing from it.
+sys.path.append(os.path.join(os.path.dirname(FRONTEND_DIR), "backend"))
+
+import requests
+
+from benchmarks.stats import percentile
+from client import BASE_URL, ApiClient, new_session
+
+
+class BareCalls:
+    """The calls app.py made before the client layer."""
+
+    def __init__(self, token):
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def rerun(self):
+        requests.get(f"{BASE_URL}/api/sweets", headers=self.headers, timeout=5).raise_for_status()
+
+    def purchase(self, sweet_id):
+        requests.post(f"{BASE_URL}/api/sweets/{sweet_id}/purchase", headers=self.headers).raise_for_status()
+        self.rerun()
+        self.rerun()
+
+    def search(self, query):
+        for field in ("name", "category"):
+            requests.get(f"{BASE_URL}/api/sweets/search", headers=self.headers, params={field: query}, timeout=5)
+
+
+class ClientCalls:
+    def __init__(self, token):
+        self.api = ApiClient(new_session())
+        self.api.token = token
+
+    def rerun(self):
+        (facets_status, _), (status_code, _) = self.api.browse(search=False)
+        assert facets_status == status_code == 200, (facets_status, status_code)
+
+    def purchase(self, sweet_id):
+        self.api.mutate("POST", f"/api/sweets/{sweet_id}/purchase").raise_for_status()
+        self.rerun()
+        self.rerun()
+
+    def search(self, query):
+        (facets_status, _), (status_code, _) = self.api.browse(query)
+        assert facets_status == status_code == 200, (facets_status, status_code)
+
+
+def measure(calls, sweet_ids, rounds):
+    timings = {"rerun": [], "purchase": [], "search": []}
+    for i in range(rounds):
+        for name, action in (
+            ("rerun", calls.rerun),
+            ("purchase", lambda: calls.purchase(sweet_ids[i % len(sweet_ids)])),
+            ("search", lambda: calls.search("bench")),
+        ):
+            started = time.perf_counter()
+            action()
+            timings[name].append(time.perf_counter() - started)
+    return timings
+
+
+def report(label, timings):
+    print(f"📊 {label}")
+    for name, samples in timings.items():
+        print(f"   {name:<9} p50 {percentile(samples, 50) * 1000:7.2f} ms, p95 {percentile(samples, 95) * 1000:7.2f} ms")
+
+
+def main(args):
+    api = ApiClient(new_session())
+    email, password = f"bench-{os.getpid()}@example.com", "bench-password"
+    resp = api.register(email, password, is_admin=True)
+    if resp.status_code != 201:
+        sys.exit(f"❌ Could not register a benchmark user: {resp.status_code} {resp.text}")
+    api.login(email, password).raise_for_status()
+    sweet_ids = []
+    try:
+        for n in range(args.sweets):
+            sweet = {"name": f"Bench sweet {n}", "category": "Benchmark", "price": 1 + n % 50, "quantity": 10**6}
+            resp = api.mutate("POST", "/api/sweets", json=sweet)
+            resp.raise_for_status()
+            sweet_ids.append(resp.json()["id"])
+        report("bare requests", measure(BareCalls(api.token), sweet_ids, args.rounds))
+        report("ApiClient", measure(ClientCalls(api.token), sweet_ids, args.rounds))
+    finally:
+        for sweet_id in sweet_ids:
+            api.mutate("DELETE", f"/api/sweets/{sweet_id}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--sweets", type=int, default=100)
+    main(parser.parse_args())
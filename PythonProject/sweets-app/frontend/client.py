@@ -0,0 +1,256 @@
+import json
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = "http://127.0.0.1:8000"
+# Catalog responses are reused without asking the backend for this long, then
+# revalidated with their ETag.
+CATALOG_TTL_SECONDS = 10
+TIMEOUT = 5
+# The backend sends a keep-alive every 15 s; silence for longer means the
+# event stream is dead.
+EVENTS_READ_TIMEOUT = 45
+# Reconnects back off from EVENTS_RETRY_SECONDS, doubling up to this.
+EVENTS_RETRY_SECONDS = 3
+EVENTS_MAX_RETRY_SECONDS = 60
+# GET /api/sweets returns this many sweets when no limit is given.
+PAGE_SIZE = 100
+
+def new_session(pool_size=16):
+    """A keep-alive session; one per process is shared by every browser tab."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class ApiClient:
+    """Backend calls for one Streamlit session.
+
+    Catalog reads are cached per token and query; any mutation made through
+    this client drops the cache so the next rerun sees its own writes. With
+    follow_events() the cached catalog listing is also patched from the
+    backend's event stream between revalidations. It is still revalidated
+    once ttl has passed: without EVENTS_CHANGE_STREAM, a backend worker only
+    sends the changes it made itself.
+    """
+
+    def __init__(self, session, base_url=BASE_URL, ttl=CATALOG_TTL_SECONDS):
+        self.session = session
+        self.base_url = base_url
+        self.ttl = ttl
+        self.token = None
+        self._catalog = {}
+        self._lock = threading.Lock()
+        self._follower = None
+        self._stop = None
+
+    def headers(self):
+        if self.token:
+            return {"Authorization": f"Bearer {self.token}"}
+        return {}
+
+    def request(self, method, path, **kwargs):
+        return self.session.request(
+            method, f"{self.base_url}{path}", headers=self.headers(), timeout=TIMEOUT, **kwargs
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._catalog.clear()
+
+    def mutate(self, method, path, **kwargs):
+        resp = self.request(method, path, **kwargs)
+        self.invalidate()
+        return resp
+
+    # --- Catalog reads ---
+    def get_catalog(self, path, params=None):
+        """GET a catalog endpoint through the cache.
+
+        Returns (status_code, data); a 304 is reported as 200 with the cached body.
+        """
+        key = (self.token, path, tuple(sorted((params or {}).items())))
+        cached = self._catalog.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return 200, cached[2]
+        headers = self.headers()
+        if cached:
+            headers["If-None-Match"] = cached[1]
+        resp = self.session.get(f"{self.base_url}{path}", headers=headers, params=params, timeout=TIMEOUT)
+        if resp.status_code == 304 and cached:
+            self._catalog[key] = (time.monotonic(), cached[1], cached[2])
+            return 200, cached[2]
+        if resp.status_code != 200:
+            return resp.status_code, None
+        data = resp.json()
+        if "ETag" in resp.headers:
+            self._catalog[key] = (time.monotonic(), resp.headers["ETag"], data)
+        return 200, data
+
+    def get_many(self, calls):
+        """Run several get_catalog calls concurrently, in order of calls."""
+        if len(calls) == 1:
+            return [self.get_catalog(*calls[0])]
+        with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+            return list(pool.map(lambda call: self.get_catalog(*call), calls))
+
+    def search(self, query=None, min_price=None, max_price=None, category=None):
+        """Sweets whose name or category starts with query, within the price range."""
+        return self.get_catalog(*_search_call(query, min_price, max_price, category))
+
+    def facets(self, query=None, min_price=None, max_price=None):
+        """Category counts, price histogram and in-stock count for a search."""
+        return self.get_catalog(*_facets_call(query, min_price, max_price))
+
+    def browse(self, query=None, min_price=None, max_price=None, category=None, search=True):
+        """(facets, sweets) for a search, or with the plain listing if not search.
+
+        The two are fetched side by side, so a rerun waits for one round trip.
+        """
+        listing = _search_call(query, min_price, max_price, category) if search else ("/api/sweets",)
+        facets, sweets = self.get_many([_facets_call(query, min_price, max_price), listing])
+        return facets, sweets
+
+    # --- Live updates ---
+    @property
+    def live(self):
+        return self._follower is not None and self._follower.is_alive()
+
+    def follow_events(self):
+        """Apply stock and price changes from GET /api/sweets/events to the cache.
+
+        The follower stops on stop_events(), once the token is refused, or
+        once this client is garbage collected with its Streamlit session.
+        """
+        if self.live:
+            return
+        self._stop = threading.Event()
+        self._follower = threading.Thread(
+            target=_follow, args=(weakref.ref(self), self.base_url, self.token, self._stop), daemon=True
+        )
+        self._follower.start()
+
+    def stop_events(self):
+        if self._stop is not None:
+            self._stop.set()
+        self._follower = None
+
+    def apply_changes(self, changes):
+        """Patch cached listings with changed sweets from the event stream."""
+        with self._lock:
+            for key, (fetched, etag, sweets) in list(self._catalog.items()):
+                # Only the plain listing is patched; search results depend on
+                # filters a delta cannot be checked against.
+                if key[1] != "/api/sweets" or key[2]:
+                    continue
+                patched = _patched(sweets, changes)
+                if patched is None:
+                    del self._catalog[key]
+                else:
+                    self._catalog[key] = (fetched, etag, patched)
+
+    # --- Auth ---
+    def register(self, email, password, is_admin=False):
+        return self.request("POST", "/api/auth/register", json={"email": email, "password": password, "is_admin": is_admin})
+
+    def login(self, email, password):
+        resp = self.request("POST", "/api/auth/login", json={"email": email, "password": password})
+        if resp.status_code == 200:
+            self.token = resp.json()["access_token"]
+            self.invalidate()
+        return resp
+
+    def logout(self):
+        try:
+            self.request("POST", "/api/auth/logout")
+        except requests.exceptions.RequestException:
+            pass
+        self.token = None
+        self.invalidate()
+
+def _filters(query, min_price, max_price):
+    params = {}
+    if query:
+        params["q"] = query
+    if min_price:
+        params["min_price"] = min_price
+    if max_price:
+        params["max_price"] = max_price
+    return params
+
+def _search_call(query, min_price, max_price, category):
+    params = _filters(query, min_price, max_price)
+    if category:
+        params["category"] = category
+    return "/api/sweets/search", params
+
+def _facets_call(query, min_price, max_price):
+    return "/api/sweets/facets", _filters(query, min_price, max_price)
+
+def _follow(client_ref, base_url, token, stop):
+    # Holds the client only through client_ref, so a closed tab's client can
+    # be collected and the thread then ends. A session of its own: the stream
+    # would otherwise hold one of the shared pool's connections while open.
+    with requests.Session() as session:
+        retry = EVENTS_RETRY_SECONDS
+        while not stop.is_set() and client_ref() is not None:
+            try:
+                with session.get(
+                    f"{base_url}/api/sweets/events", headers={"Authorization": f"Bearer {token}"},
+                    stream=True, timeout=(TIMEOUT, EVENTS_READ_TIMEOUT),
+                ) as resp:
+                    if resp.status_code in (401, 403):
+                        # Expired or revoked; retrying cannot help.
+                        return
+                    if resp.status_code == 200:
+                        retry = EVENTS_RETRY_SECONDS
+                        _read_events(client_ref, resp, stop)
+            except requests.exceptions.RequestException:
+                pass
+            # Changes made while disconnected are missed.
+            _invalidate(client_ref)
+            stop.wait(retry)
+            retry = min(retry * 2, EVENTS_MAX_RETRY_SECONDS)
+
+def _invalidate(client_ref):
+    client = client_ref()
+    if client is not None:
+        client.invalidate()
+
+def _read_events(client_ref, resp, stop):
+    event = None
+    # Keep-alives arrive every 15 s, so a collected client is noticed soon.
+    for line in resp.iter_lines(decode_unicode=True):
+        client = client_ref()
+        if stop.is_set() or client is None:
+            return
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:") and event == "stock":
+            client.apply_changes(json.loads(line[len("data:"):]))
+        elif line.startswith("data:") and event == "resync":
+            client.invalidate()
+        elif not line:
+            event = None
+        del client
+
+def _patched(sweets, changes):
+    """The listing page with changes applied, or None if it must be refetched."""
+    by_id = {sweet["id"]: sweet for sweet in sweets}
+    last_id = sweets[-1]["id"] if sweets else ""
+    for change in changes:
+        if change.get("deleted"):
+            by_id.pop(change["id"], None)
+        elif change["id"] in by_id:
+            by_id[change["id"]] = {**by_id[change["id"]], **change}
+        elif change["id"] < last_id or len(sweets) < PAGE_SIZE:
+            # Ids are ordered; an unknown one before the end of the page, or
+            # on a last page with room, is a sweet this page is missing.
+            return None
+    return [by_id[sweet["id"]] for sweet in sweets if sweet["id"] in by_id]